@@ -0,0 +1,79 @@
+"""
+Compare the object and columnar implementations of ``Worker.get_nodes`` on a
+synthetic ``health/state/any`` payload.
+
+Usage:  python bench/bench_columnar.py [NODES] [CHECKS_PER_NODE]
+
+"""
+import random
+import sys
+import timeit
+
+from flatline import Worker
+
+
+def make_blobs(nodes, checks_per_node, seed=0):
+    rng = random.Random(seed)
+    blobs = []
+    for i in range(nodes):
+        name = 'node-{:06d}'.format(i)
+        for j in range(checks_per_node):
+            status = rng.choice(['passing'] * 18 + ['warning', 'critical'])
+            check_id = 'serfHealth' if j == 0 else 'service:svc{}'.format(j)
+            blobs.append({
+                'Node': name,
+                'CheckID': check_id,
+                'Name': 'Check {}'.format(j),
+                'Status': status,
+                'Notes': '',
+                'Output': '',
+                'ServiceID': '',
+                'ServiceName': '',
+            })
+        if rng.random() < 0.01:
+            blobs.append({
+                'Node': name,
+                'CheckID': '_node_maintenance',
+                'Name': 'Node Maintenance Mode',
+                'Status': 'critical',
+                'Notes': '',
+                'Output': '',
+                'ServiceID': '',
+                'ServiceName': '',
+            })
+    rng.shuffle(blobs)
+    return blobs
+
+
+def summarize(nodes):
+    return [(node.name, node.healthy) for node in nodes.values()]
+
+
+def main(argv):
+    nodes = int(argv[1]) if len(argv) > 1 else 20000
+    checks_per_node = int(argv[2]) if len(argv) > 2 else 5
+    blobs = make_blobs(nodes, checks_per_node)
+
+    workers = {
+        'object': Worker(None, None, None),
+        'columnar': Worker(None, None, None, columnar=True),
+    }
+    for worker in workers.values():
+        worker.get_check_blobs = lambda: blobs
+
+    results = {
+        label: summarize(worker.get_nodes())
+        for label, worker in workers.items()
+    }
+    assert results['object'] == results['columnar'], 'Results differ!'
+
+    print('{} checks across {} nodes'.format(len(blobs), nodes))
+    for label, worker in workers.items():
+        # Include the health evaluation, which the object path does lazily.
+        timer = timeit.Timer(lambda: summarize(worker.get_nodes()))
+        best = min(timer.repeat(repeat=5, number=1))
+        print('{:>10}:  {:8.1f} ms'.format(label, best * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
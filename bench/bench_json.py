@@ -0,0 +1,74 @@
+"""
+Compare ways of decoding a ``health/state/any`` response.
+
+``requests`` is the old path:  ``r.text`` for the debug log, then
+``r.json()``.  The others decode the raw bytes with each installed backend,
+as :meth:`flatline.Consul.call` now does.
+
+Usage:  python bench/bench_json.py [NODES] [CHECKS_PER_NODE]
+
+"""
+import json
+import sys
+import timeit
+
+from requests.models import Response
+
+from flatline.codec import BACKENDS, get_decoder
+from bench_columnar import make_blobs
+
+
+def make_payload(nodes, checks_per_node):
+    blobs = make_blobs(nodes, checks_per_node)
+    for i, blob in enumerate(blobs):
+        # Real checks carry output, and Consul 1.x adds these fields.
+        blob['Output'] = (
+            'HTTP GET http://10.0.{}.{}:8080/health: 200 OK Output: '
+            '{{"status":"ok","uptime":{}}}'.format(i % 250, i % 200, i)
+        )
+        blob['ServiceTags'] = ['v1', 'primary']
+        blob['Type'] = 'http'
+        blob['Definition'] = {}
+        blob['CreateIndex'] = i
+        blob['ModifyIndex'] = i * 3
+    return json.dumps(blobs).encode('utf-8')
+
+
+def make_response(payload):
+    r = Response()
+    r.status_code = 200
+    r._content = payload
+    r.headers['Content-Type'] = 'application/json'
+    return r
+
+
+def requests_path(payload):
+    r = make_response(payload)
+    r.text
+    return r.json()
+
+
+def main(argv):
+    nodes = int(argv[1]) if len(argv) > 1 else 20000
+    checks_per_node = int(argv[2]) if len(argv) > 2 else 5
+    payload = make_payload(nodes, checks_per_node)
+    expected = json.loads(payload)
+    print('{:.1f} MB payload, {} checks'.format(
+        len(payload) / 1e6, len(expected),
+    ))
+
+    candidates = [('requests', requests_path)]
+    for name, _ in BACKENDS:
+        try:
+            candidates.append(get_decoder(name))
+        except ImportError:
+            print('{:>10}:  not installed'.format(name))
+    for name, decode in candidates:
+        assert decode(payload) == expected, name
+        timer = timeit.Timer(lambda: decode(payload))
+        best = min(timer.repeat(repeat=5, number=1))
+        print('{:>10}:  {:8.1f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,59 @@
+"""
+Measure the cold-start cost of flatline, as paid by every cron or Lambda
+invocation of ``flatline --once``.
+
+Each scenario runs in a fresh interpreter.  Reports the best wall time and
+whether boto3 or requests were imported.
+
+Usage:  python bench/bench_startup.py [RUNS]
+
+"""
+import json
+import subprocess
+import sys
+import time
+
+
+SCENARIOS = [
+    ('interpreter', 'pass'),
+    ('import flatline', 'import flatline'),
+    (
+        'parse --once',
+        'import flatline; flatline.parse_args(["--once"])',
+    ),
+    (
+        'build worker',
+        'import flatline; '
+        'flatline.Worker(flatline.Consul(), flatline.LazyClient("ec2"), '
+        'flatline.LazyClient("autoscaling"))',
+    ),
+]
+
+REPORT = (
+    '; import sys, json; '
+    'print(json.dumps([m in sys.modules for m in ("boto3", "requests")]))'
+)
+
+
+def run(code):
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', code + REPORT])
+    return time.perf_counter() - start, json.loads(out)
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 10
+    print('{:<16} {:>9}  {:>6} {:>9}'.format(
+        'scenario', 'best (ms)', 'boto3', 'requests',
+    ))
+    for label, code in SCENARIOS:
+        results = [run(code) for _ in range(runs)]
+        best = min(elapsed for elapsed, _ in results)
+        boto3, requests = results[0][1]
+        print('{:<16} {:>9.1f}  {:>6} {:>9}'.format(
+            label, best * 1000, str(boto3), str(requests),
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
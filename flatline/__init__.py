@@ -1,19 +1,71 @@
 import logging
 import itertools
-from time import sleep
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import attrgetter
+from time import sleep, time
 try:
     from urllib.parse import urljoin
 except ImportError:
     from urlparse import urljoin
 
-import boto3
-import requests
-
-from .decorator import reify
+from .aws import DEFAULT_ROUTE, ClientPool, Route, Router
+from .codec import BACKENDS, get_decoder
+from .decorator import CacheStore, cached
+from .journal import Journal
+from .policy import Policy
+from .watch import Watch
 
 
 logger = logging.getLogger('flatline')
-logging.basicConfig(level=logging.INFO)
+
+#: The maximum number of values allowed in a single EC2 filter.
+EC2_FILTER_LIMIT = 200
+
+#: The maximum number of instance IDs per ``DescribeAutoScalingInstances``.
+ASG_DESCRIBE_LIMIT = 50
+
+#: The maximum number of seconds a failed node lookup is cached.
+NEGATIVE_CACHE_TTL = 30
+
+
+def chunked(items, size):
+    """
+    Split a list into lists of at most ``size`` items.
+
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class LazyClient(object):
+    """
+    A boto3 client that is not created, nor boto3 imported, until it is first
+    used.
+
+    :param service:  The AWS service name, e.g. ``ec2``.
+    :type service:  str
+
+    Any additional keyword arguments are passed to :func:`boto3.client`.
+
+    """
+    def __init__(self, service, **kwargs):
+        self.service = service
+        self.kwargs = kwargs
+
+    @cached
+    def client(self):
+        """
+        The underlying boto3 client.
+
+        """
+        import boto3
+        return boto3.client(self.service, **self.kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
 
 
 class Consul(object):
@@ -22,12 +74,17 @@ class Consul(object):
 
     :param url:  The URL of the Consul HTTP API.
     :type url:  str
+    :param decoder:  The JSON decoder backend to use.  See
+    :func:`flatline.codec.get_decoder`.
+    :type decoder:  str
 
     """
-    def __init__(self, url='http://localhost:8500/'):
+    def __init__(self, url='http://localhost:8500/', decoder='auto'):
         self.url = url
+        self.decoder, self.loads = get_decoder(decoder)
 
-    def call(self, method, path, params={}, data={}, retry=False):
+    def call(self, method, path, params={}, data={}, retry=False,
+             timeout=70):
         """
         Make a call to Consul.
 
@@ -42,27 +99,36 @@ class Consul(object):
         :param retry:  If ``True``, the call will be retried indefinitely if it
         fails.
         :type retry:  bool
+        :param timeout:  The number of seconds to wait for a response.  Must
+        exceed the ``wait`` of blocking queries.
+        :type timeout:  float
 
         :returns:  A two-tuple of the decoded response body and the
         X-Consul-Index header.
 
         """
+        # Deferred, as requests is slow to import.
+        import requests
         url = urljoin(self.url, path)
         while True:
             try:
                 logger.debug('Consul request: %s %s', method, url)
-                logger.debug('Request body: %s', str(data))
+                logger.debug('Request body: %s', data)
                 r = requests.request(
                     method,
                     url,
                     params=params,
                     json=data,
-                    timeout=70,
+                    timeout=timeout,
                 )
                 r.raise_for_status()
                 logger.debug('Consul response:  HTTP %s', r.status_code)
-                logger.debug('Response body:  %s', r.text)
-                return r.json(), r.headers.get('X-Consul-Index')
+                # Decode straight from the bytes.  ``r.text`` would guess the
+                # encoding and copy the whole body, so only use it if it will
+                # actually be logged.
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('Response body:  %s', r.text)
+                return self.loads(r.content), r.headers.get('X-Consul-Index')
             except requests.RequestException:
                 if not retry:
                     raise
@@ -115,21 +181,38 @@ class Node(object):
     :type name:  str
     :param checks:  The checks associated with the node.
     :type checks:  A list of :class:`Check` objects.
+    :param cache:  A store shared between nodes, so that remote lookups
+    outlive a single :class:`Node`.  If ``None``, lookups are cached on the
+    node itself.
+    :type cache:  :class:`flatline.decorator.CacheStore`
+    :param policy:  The policy judging the node's health.  If ``None``, all
+    checks must be passing.
+    :type policy:  :class:`flatline.policy.Policy`
 
     """
-    def __init__(self, consul, ec2, asg, name, checks):
+    def __init__(self, consul, ec2, asg, name, checks, cache=None,
+                 policy=None):
         self.consul = consul
         self.ec2 = ec2
         self.asg = asg
         self.name = name
         self.checks = checks
+        self.cache = cache
+        self.policy = policy
 
     @property
     def healthy(self):
         """
-        ``True`` if all health checks are passing.
+        ``True`` if all health checks are passing, or if the node passes the
+        :attr:`policy`.
 
         """
+        if self.policy is not None:
+            # The checks never change, so judge them only once.
+            healthy = self.__dict__.get('_policy_healthy')
+            if healthy is None:
+                healthy = self._policy_healthy = self.policy.healthy(self)
+            return healthy
         return all(check.healthy for check in self.checks)
 
     @property
@@ -140,7 +223,7 @@ class Node(object):
         """
         return any(check.id == '_node_maintenance' for check in self.checks)
 
-    @reify
+    @cached(key=attrgetter('name'), store='cache')
     def blob(self):
         """
         The JSON node representation from Consul.
@@ -149,19 +232,35 @@ class Node(object):
         return self.consul.get('v1/catalog/node/{}'.format(self.name))[0]
 
     @property
+    def meta(self):
+        """
+        The node meta from Consul.
+
+        """
+        blob = self.blob
+        if blob is None:
+            return {}
+        return blob['Node'].get('Meta') or {}
+
+    @cached(key=attrgetter('name'), store='cache')
     def ip(self):
         """
-        The IP address of the node.
+        The IP address of the node, or ``None`` if it is not in the catalog.
 
         """
-        return self.blob['Node']['Address']
+        blob = self.blob
+        if blob is None:
+            return None
+        return blob['Node']['Address']
 
-    @reify
+    @cached(key=attrgetter('name'), store='cache')
     def instance_id(self):
         """
         The EC2 instance ID.
 
         """
+        if self.ip is None:
+            return None
         r = self.ec2.describe_instances(
             Filters=[
                 {
@@ -178,20 +277,31 @@ class Node(object):
             raise ValueError('Multiple results found.')
         return instances[0]['InstanceId']
 
-    @reify
-    def is_asg_instance(self):
+    @cached(key=attrgetter('name'), store='cache')
+    def asg_name(self):
         """
-        ``True`` if the instance is part of an autoscaling group.
+        The name of the instance's autoscaling group, or ``None`` if it is not
+        part of one.
 
         """
         id = self.instance_id
         if id is None:
-            return False
+            return None
         r = self.asg.describe_auto_scaling_instances(
             InstanceIds=[self.instance_id],
         )
         instances = r['AutoScalingInstances']
-        return len(instances) > 0
+        if len(instances) == 0:
+            return None
+        return instances[0]['AutoScalingGroupName']
+
+    @property
+    def is_asg_instance(self):
+        """
+        ``True`` if the instance is part of an autoscaling group.
+
+        """
+        return self.asg_name is not None
 
     def update_instance_health(self):
         """
@@ -206,16 +316,83 @@ class Node(object):
 
 class Worker(object):
     """
+    Watches Consul health checks and mirrors them onto ASG instance health.
+
+    :param consul:  The Consul client.
+    :type consul:  :class:`Consul`
+    :param ec2:  The EC2 client.
+    :type ec2:  :class:`boto3.EC2.Client`
+    :param asg:  The ASG client
+    :type asg:  :class:`boto3.AutoScaling.Client`
+    :param columnar:  If ``True``, aggregate node health with the vectorized
+    NumPy implementation in :mod:`flatline.columnar`.
+    :type columnar:  bool
+    :param journal:  If given, node transitions are recorded to the journal.
+    :type journal:  :class:`flatline.journal.Journal`
+    :param cache_ttl:  The number of seconds node addresses, instance IDs and
+    ASG membership are cached across cycles.  Failed lookups are cached for
+    at most :data:`NEGATIVE_CACHE_TTL` seconds, and nodes that leave the
+    cluster are forgotten.
+    :type cache_ttl:  float
+    :param router:  If given, nodes are routed to per-region and per-account
+    clients, and each route is handled concurrently.  Nodes on the default
+    route use ``ec2`` and ``asg``.
+    :type router:  :class:`flatline.aws.Router`
+    :param wait:  The number of seconds each Consul query may block for.
+    :type wait:  int
+    :param min_interval:  The minimum number of seconds between Consul
+    queries.
+    :type min_interval:  float
+    :param policy:  The policy judging node health.
+    :type policy:  :class:`flatline.policy.Policy`
 
     """
-    last_index = None
+    last_observed = None
+    paused = False
 
-    def __init__(self, consul, ec2, asg):
+    def __init__(self, consul, ec2, asg, columnar=False, journal=None,
+                 cache_ttl=300, router=None, wait=60, min_interval=1.0,
+                 policy=None):
         super(Worker, self).__init__()
         self.consul = consul
+        self.policy = policy
+        self.watch = Watch(
+            consul,
+            'v1/health/state/any',
+            wait=wait,
+            min_interval=min_interval,
+        )
         self.ec2 = ec2
         self.asg = asg
+        self.journal = journal
+        self.router = router
+        self.cache = CacheStore(
+            ttl=cache_ttl,
+            negative_ttl=NEGATIVE_CACHE_TTL,
+        )
         self.prev_nodes = {}
+        # Transitions not yet dispatched because the worker is paused, as
+        # node names mapped to the index and time they were observed at.
+        self.pending = {}
+        # Serializes dispatching between the worker and control threads.
+        self.lock = threading.RLock()
+        self.columnar = None
+        if columnar:
+            # Imported here so NumPy remains an optional dependency.
+            from .columnar import get_nodes_columnar
+            self.columnar = get_nodes_columnar
+
+    @property
+    def last_index(self):
+        """
+        The Consul index of the last health check query.
+
+        """
+        return self.watch.index
+
+    @last_index.setter
+    def last_index(self, value):
+        self.watch.index = value
 
     def run(self):
         """
@@ -233,16 +410,444 @@ class Worker(object):
 
         """
         nodes = self.get_nodes()
-        updated = self.diff_nodes(self.prev_nodes, nodes)
-        self.prev_nodes = nodes
-        for node in updated:
-            logging.info(
-                '%s is now %s',
-                node.name,
+        with self.lock:
+            updated = list(self.diff_nodes(self.prev_nodes, nodes))
+            self.prev_nodes = nodes
+            for node in updated:
+                logging.info(
+                    '%s is now %s',
+                    node.name,
+                    'Healthy' if node.healthy else 'Unhealthy',
+                )
+            if self.paused:
+                for node in updated:
+                    self.pending[node.name] = (
+                        self.last_index, self.last_observed,
+                    )
+                return
+            self.dispatch(updated, self.update_nodes)
+        if self.journal is not None and updated:
+            self.journal.write_summary()
+
+    def pause(self):
+        """
+        Stop updating ASG health.  Transitions are still tracked, and are
+        dispatched by :meth:`resume`.
+
+        """
+        with self.lock:
+            self.paused = True
+        logger.info('Dispatch paused.')
+
+    def resume(self):
+        """
+        Resume updating ASG health, dispatching any transitions that happened
+        while paused.
+
+        :returns:  The names of the dispatched nodes.
+        :rtype:  list
+
+        """
+        with self.lock:
+            self.paused = False
+            # Use the latest node, as the health may have changed back.
+            pending = [
+                self.prev_nodes[name] for name in sorted(self.pending)
+                if name in self.prev_nodes
+            ]
+            observed = self.pending
+            self.pending = {}
+            logger.info(
+                'Dispatch resumed, %s pending transitions.', len(pending),
+            )
+            self.dispatch(
+                pending, partial(self.update_nodes, observed=observed),
+            )
+        return [node.name for node in pending]
+
+    def invalidate(self, name=None):
+        """
+        Discard cached addresses, instance IDs and ASG membership.
+
+        :param name:  The node name, or ``None`` for every node.
+        :type name:  str
+
+        :returns:  The number of entries discarded.
+        :rtype:  int
+
+        """
+        if name is None:
+            keys = self.cache.keys()
+            self.cache.invalidate()
+        else:
+            keys = [key for key in self.cache.keys() if key[1] == name]
+            self.cache.invalidate(*keys)
+        return len(keys)
+
+    def resync_node(self, name):
+        """
+        Re-resolve a single node and set its ASG health, whether or not it
+        has changed.
+
+        :param name:  The node name.
+        :type name:  str
+
+        :returns:  The node.
+        :rtype:  :class:`Node`
+
+        :raises KeyError:  If the node is unknown.
+
+        """
+        with self.lock:
+            node = self.prev_nodes[name]
+            self.invalidate(name)
+            logger.info(
+                'Resyncing %s as %s.',
+                name,
                 'Healthy' if node.healthy else 'Unhealthy',
             )
-            if node.is_asg_instance:
+            self.pending.pop(name, None)
+            self.dispatch([node], partial(self.update_nodes, event='resync'))
+        return node
+
+    def resync_asg(self, name):
+        """
+        Set the ASG health of every known node in an autoscaling group,
+        whether or not it has changed.
+
+        :param name:  The autoscaling group name.
+        :type name:  str
+
+        :returns:  A dictionary of counts, as from :meth:`reconcile`.
+        :rtype:  dict
+
+        """
+        with self.lock:
+            logger.info('Resyncing autoscaling group %s.', name)
+            return self.reconcile(self.prev_nodes, asg_name=name, force=True)
+
+    def describe(self):
+        """
+        Describe the worker's state, without making any remote calls.
+
+        :rtype:  dict
+
+        """
+        cache = self.cache
+        nodes = {}
+        for name, node in list(self.prev_nodes.items()):
+            nodes[name] = {
+                'healthy': node.healthy,
+                'pending': name in self.pending,
+                'ip': cache.peek(('ip', name)),
+                'instance_id': cache.peek(('instance_id', name)),
+                'asg_name': cache.peek(('asg_name', name)),
+            }
+        return {
+            'paused': self.paused,
+            'watch': self.watch.stats(),
+            'cached': len(cache),
+            'nodes': nodes,
+        }
+
+    def update_nodes(self, nodes, observed={}, event='transition'):
+        """
+        Update the ASG health of nodes that have changed.
+
+        :param nodes:  The nodes.
+        :type nodes:  list
+        :param observed:  The index and time each node's transition was
+        observed at, by node name.  Defaults to those of the last query.
+        :type observed:  dict
+        :param event:  The journal event type.
+        :type event:  str
+
+        """
+        for node in nodes:
+            if self.journal is None:
+                if node.is_asg_instance:
+                    node.update_instance_health()
+            else:
+                self.update_node_journaled(
+                    node, observed.get(node.name), event=event,
+                )
+
+    def group_nodes(self, nodes):
+        """
+        Group nodes by their :class:`flatline.aws.Route` and give each node
+        the clients for its route.  Without a :attr:`router`, all nodes are
+        placed in a single group and keep the worker's clients.
+
+        :param nodes:  The nodes.
+        :type nodes:  list
+
+        :returns:  A dictionary of routes to lists of nodes.
+        :rtype:  dict
+
+        """
+        if self.router is None:
+            return {None: nodes} if nodes else {}
+        groups = {}
+        for node in nodes:
+            route = self.router.route(node)
+            if route == DEFAULT_ROUTE:
+                node.ec2, node.asg = self.ec2, self.asg
+            else:
+                node.ec2, node.asg = self.router.clients(route)
+            groups.setdefault(route, []).append(node)
+        return groups
+
+    def dispatch(self, nodes, func):
+        """
+        Call ``func`` with each group of nodes from :meth:`group_nodes`.  The
+        groups are run concurrently, so the latency of one region does not
+        hold up the others.
+
+        :param nodes:  The nodes.
+        :type nodes:  list
+        :param func:  A function accepting a list of nodes with the same
+        route.
+
+        :returns:  A list of the return values of ``func``.
+        :rtype:  list
+
+        """
+        groups = self.group_nodes(nodes)
+        if len(groups) <= 1:
+            return [func(group) for group in groups.values()]
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(func, group) for group in groups.values()
+            ]
+            return [future.result() for future in futures]
+
+    def update_node_journaled(self, node, observed=None, event='transition'):
+        """
+        Update the ASG health of a node and record the transition, with
+        timestamps for each step, to :attr:`journal`.
+
+        :param node:  The node that has changed.
+        :type node:  :class:`Node`
+        :param observed:  The index and time the transition was observed at.
+        Defaults to those of the last query.
+        :type observed:  tuple
+        :param event:  The journal event type.  Only ``transition`` events
+        count towards the propagation latency.
+        :type event:  str
+
+        """
+        index, observed_at = observed or (self.last_index, self.last_observed)
+        instance_id = node.instance_id
+        resolved_at = time()
+        sent_at = acked_at = None
+        if node.is_asg_instance:
+            sent_at = time()
+            node.update_instance_health()
+            acked_at = time()
+        self.journal.record(
+            node.name,
+            node.healthy,
+            index,
+            observed_at,
+            instance_id=instance_id,
+            resolved_at=resolved_at,
+            sent_at=sent_at,
+            acked_at=acked_at,
+            event=event,
+        )
+
+    def reconcile(self, nodes=None, asg_name=None, force=False):
+        """
+        Make a single pass over every node, resolving addresses, instance IDs
+        and ASG membership in bulk, and set the ASG health of any instance
+        whose health differs from Consul.
+
+        :param nodes:  The nodes to reconcile.  If ``None``, Consul is queried
+        and the result becomes :attr:`prev_nodes`.
+        :type nodes:  dict
+        :param asg_name:  Only reconcile instances in this autoscaling group.
+        :type asg_name:  str
+        :param force:  If ``True``, set the ASG health even if it already
+        matches.
+        :type force:  bool
+
+        :returns:  A dictionary of counts summarizing the pass.
+        :rtype:  dict
+
+        """
+        if nodes is None:
+            nodes = self.get_nodes()
+            self.prev_nodes = nodes
+        summary = {
+            'nodes': len(nodes),
+            'resolved': 0,
+            'asg_instances': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'failed': 0,
+        }
+
+        catalog, _ = self.consul.get('v1/catalog/nodes')
+        catalog = {obj['Node']: obj for obj in catalog}
+        found = []
+        for node in nodes.values():
+            obj = catalog.get(node.name)
+            if obj is None:
+                node.ip = None
+                node.instance_id = None
+            else:
+                # The catalog listing holds everything a route needs.
+                node.blob = {'Node': obj}
+                found.append(node)
+
+        reconcile = partial(
+            self.reconcile_nodes,
+            asg_name=asg_name,
+            force=force,
+        )
+        for counts in self.dispatch(found, reconcile):
+            for key, value in counts.items():
+                summary[key] += value
+        return summary
+
+    def reconcile_nodes(self, nodes, asg_name=None, force=False):
+        """
+        Reconcile the ASG health of nodes sharing the same clients.
+
+        :param nodes:  The nodes, with known IP addresses.
+        :type nodes:  list
+        :param asg_name:  Only reconcile instances in this autoscaling group.
+        :type asg_name:  str
+        :param force:  If ``True``, set the ASG health even if it already
+        matches.
+        :type force:  bool
+
+        :returns:  A dictionary of counts summarizing the pass.
+        :rtype:  dict
+
+        """
+        summary = {
+            'resolved': 0,
+            'asg_instances': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'failed': 0,
+        }
+        ec2, asg = nodes[0].ec2, nodes[0].asg
+        by_ip = {node.ip: node for node in nodes}
+        instance_ids = self.resolve_instance_ids(list(by_ip), ec2)
+        by_id = {}
+        for ip, node in by_ip.items():
+            node.instance_id = instance_ids.get(ip)
+            if node.instance_id is not None:
+                by_id[node.instance_id] = node
+        summary['resolved'] = len(by_id)
+
+        asg_instances = self.describe_asg_instances(list(by_id), asg)
+        for id, node in by_id.items():
+            instance = asg_instances.get(id)
+            if instance is None:
+                node.asg_name = None
+                continue
+            node.asg_name = instance['AutoScalingGroupName']
+            if asg_name is not None and node.asg_name != asg_name:
+                continue
+            summary['asg_instances'] += 1
+            current = instance['HealthStatus']
+            desired = 'HEALTHY' if node.healthy else 'UNHEALTHY'
+            if current.upper() == desired and not force:
+                summary['unchanged'] += 1
+                continue
+            logger.info(
+                '%s is %s in the ASG, setting to %s',
+                node.name,
+                current.capitalize(),
+                desired.capitalize(),
+            )
+            try:
                 node.update_instance_health()
+            except Exception:
+                logger.exception('Could not update %s.', node.name)
+                summary['failed'] += 1
+            else:
+                summary['updated'] += 1
+        return summary
+
+    def resolve_instance_ids(self, ips, ec2=None):
+        """
+        Look up the EC2 instances with the given private IP addresses.
+
+        :param ips:  The IP addresses.
+        :type ips:  list
+        :param ec2:  The EC2 client to use.  Defaults to :attr:`ec2`.
+        :type ec2:  :class:`boto3.EC2.Client`
+
+        :returns:  A dictionary mapping IP addresses to instance IDs.
+        Addresses without exactly one instance are omitted.
+        :rtype:  dict
+
+        """
+        if ec2 is None:
+            ec2 = self.ec2
+        wanted = set(ips)
+        found = {}
+        paginator = ec2.get_paginator('describe_instances')
+        for chunk in chunked(ips, EC2_FILTER_LIMIT):
+            pages = paginator.paginate(
+                Filters=[
+                    {
+                        'Name': 'private-ip-address',
+                        'Values': chunk,
+                    },
+                ],
+            )
+            for page in pages:
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        for ip in self._instance_ips(instance) & wanted:
+                            found.setdefault(ip, set()).add(
+                                instance['InstanceId'],
+                            )
+        instance_ids = {}
+        for ip, ids in found.items():
+            if len(ids) > 1:
+                logger.warning('Multiple instances found for %s.', ip)
+                continue
+            instance_ids[ip] = ids.pop()
+        return instance_ids
+
+    @staticmethod
+    def _instance_ips(instance):
+        ips = {instance.get('PrivateIpAddress')}
+        for interface in instance.get('NetworkInterfaces', []):
+            for address in interface.get('PrivateIpAddresses', []):
+                ips.add(address.get('PrivateIpAddress'))
+        ips.discard(None)
+        return ips
+
+    def describe_asg_instances(self, instance_ids, asg=None):
+        """
+        Look up the ASG membership and health of the given instances.
+
+        :param instance_ids:  The EC2 instance IDs.
+        :type instance_ids:  list
+        :param asg:  The ASG client to use.  Defaults to :attr:`asg`.
+        :type asg:  :class:`boto3.AutoScaling.Client`
+
+        :returns:  A dictionary mapping instance IDs to their
+        ``AutoScalingInstances`` entry.  Instances not in an autoscaling group
+        are omitted.
+        :rtype:  dict
+
+        """
+        if asg is None:
+            asg = self.asg
+        found = {}
+        for chunk in chunked(instance_ids, ASG_DESCRIBE_LIMIT):
+            r = asg.describe_auto_scaling_instances(InstanceIds=chunk)
+            for instance in r['AutoScalingInstances']:
+                found[instance['InstanceId']] = instance
+        return found
 
     def diff_nodes(self, prev_nodes, nodes):
         """
@@ -270,41 +875,266 @@ class Worker(object):
         :class:`Node` as values.
 
         """
+        if self.columnar is not None:
+            return self.columnar(self)
+        checks = self.get_checks()
+        if not self.watch.changed and self.prev_nodes:
+            return self.prev_nodes
+        if self.policy is not None:
+            self.policy.begin()
         nodes = dict()
-        checks = sorted(self.get_checks(), key=lambda x: x.node)
+        checks = sorted(checks, key=lambda x: x.node)
         for name, checks in itertools.groupby(checks, lambda x: x.node):
-            node = Node(self.consul, self.ec2, self.asg, name, list(checks))
+            node = Node(
+                self.consul,
+                self.ec2,
+                self.asg,
+                name,
+                list(checks),
+                cache=self.cache,
+                policy=self.policy,
+            )
             if not node.maintenance:
                 nodes[node.name] = node
+        self.forget_departed(nodes)
+        if self.policy is not None and self.policy.groups:
+            self.prime_blobs(nodes)
         return nodes
 
+    def forget_departed(self, nodes):
+        """
+        Discard the cached details of nodes that are no longer present, so a
+        replacement reusing a name is looked up afresh.
+
+        :param nodes:  The current nodes.
+        :type nodes:  dict
+
+        """
+        departed = [key for key in self.cache.keys() if key[1] not in nodes]
+        if departed:
+            logger.debug(
+                'Forgetting %s cached entries of departed nodes.',
+                len(departed),
+            )
+            self.cache.invalidate(*departed)
+
+    def prime_blobs(self, nodes):
+        """
+        Fetch the catalog entries of any nodes without a cached
+        :attr:`Node.blob` with a single bulk query, rather than one query per
+        node.
+
+        :param nodes:  The nodes.
+        :type nodes:  dict
+
+        """
+        missing = [
+            node for node in nodes.values()
+            if self.cache.peek(('blob', node.name), self) is self
+        ]
+        if not missing:
+            return
+        catalog, _ = self.consul.get('v1/catalog/nodes')
+        catalog = {obj['Node']: obj for obj in catalog}
+        for node in missing:
+            obj = catalog.get(node.name)
+            node.blob = None if obj is None else {'Node': obj}
+
     def get_checks(self):
         """
-        Query Consul for health checks.  Blocks for up to 60 seconds while
-        waiting for changes.
+        Query Consul for health checks.  Blocks for up to the watch's jittered
+        ``wait`` while waiting for changes.
 
         :returns:  A list of :class:`Check` objects.
 
+        """
+        return [Check(obj) for obj in self.get_check_blobs()]
+
+    def get_check_blobs(self):
+        """
+        Query Consul for health checks, without wrapping them in
+        :class:`Check`.  Blocks for up to the watch's jittered ``wait`` while
+        waiting for changes.
+
+        :returns:  A list of check JSON blobs.
+
         """
         logging.info('Querying Consul for health checks.')
-        if self.last_index is None:
-            params = {}
-        else:
-            params = {
-                'wait': '60s',
-                'index': self.last_index,
-            }
-        r, index = self.consul.get(
-            'v1/health/state/any',
-            params,
-        )
-        self.last_index = index
-        return [Check(obj) for obj in r]
+        r = self.watch.poll()
+        self.last_observed = time()
+        return r
 
 
-def main():
-    consul = Consul()
-    ec2 = boto3.client('ec2')
-    asg = boto3.client('autoscaling')
-    worker = Worker(consul, ec2, asg)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='flatline',
+        description=(
+            'Watch Consul health checks and update AWS ASG health checks '
+            'accordingly.'
+        ),
+    )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help=(
+            'Reconcile the ASG health of every node once and exit, rather '
+            'than watching for changes.'
+        ),
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=300,
+        metavar='SECONDS',
+        help=(
+            'How long node addresses, instance IDs and ASG membership are '
+            'cached.  (Default:  %(default)s)'
+        ),
+    )
+    parser.add_argument(
+        '--route',
+        action='append',
+        default=[],
+        metavar='CIDR=REGION[,ROLE_ARN]',
+        help=(
+            'Route nodes with an address in CIDR to the given region, '
+            'optionally assuming ROLE_ARN.  May be repeated.'
+        ),
+    )
+    parser.add_argument(
+        '--region-meta-key',
+        metavar='KEY',
+        help='Route nodes by the region in this Consul node meta key.',
+    )
+    parser.add_argument(
+        '--role-meta-key',
+        default='aws-role-arn',
+        metavar='KEY',
+        help=(
+            'With --region-meta-key, assume the role ARN in this Consul node '
+            'meta key.  (Default:  %(default)s)'
+        ),
+    )
+    parser.add_argument(
+        '--wait',
+        type=int,
+        default=60,
+        metavar='SECONDS',
+        help=(
+            'How long each Consul query may block for.  '
+            '(Default:  %(default)s)'
+        ),
+    )
+    parser.add_argument(
+        '--min-interval',
+        type=float,
+        default=1.0,
+        metavar='SECONDS',
+        help=(
+            'The minimum time between Consul queries.  '
+            '(Default:  %(default)s)'
+        ),
+    )
+    parser.add_argument(
+        '--columnar',
+        action='store_true',
+        help=(
+            'Aggregate health checks with NumPy, which is faster for large '
+            'clusters.  Requires the columnar extra.'
+        ),
+    )
+    parser.add_argument(
+        '--json-decoder',
+        choices=['auto'] + [name for name, _ in BACKENDS],
+        default='auto',
+        help=(
+            'The JSON library used to decode Consul responses.  '
+            '(Default:  the fastest installed)'
+        ),
+    )
+    parser.add_argument(
+        '--control',
+        metavar='PATH',
+        help=(
+            'Listen for control commands on this Unix socket.  See '
+            'flatline.control.'
+        ),
+    )
+    parser.add_argument(
+        '--policy',
+        metavar='PATH',
+        help='Judge node health with the JSON policy in this file.',
+    )
+    parser.add_argument(
+        '--journal',
+        metavar='PATH',
+        help='Record node transitions as JSON lines to this file.',
+    )
+    args = parser.parse_args(argv)
+    if args.json_decoder != 'auto':
+        try:
+            get_decoder(args.json_decoder)
+        except ImportError:
+            parser.error('--json-decoder {0} requires {0}.'.format(
+                args.json_decoder,
+            ))
+    if args.columnar:
+        try:
+            import numpy  # noqa
+        except ImportError:
+            parser.error(
+                '--columnar requires NumPy.  Install flatline[columnar].'
+            )
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    consul = Consul(decoder=args.json_decoder)
+    logger.debug('Decoding JSON with %s.', consul.decoder)
+    ec2 = LazyClient('ec2')
+    asg = LazyClient('autoscaling')
+    journal = None
+    if args.journal:
+        journal = Journal(args.journal)
+    policy = None
+    if args.policy:
+        policy = Policy.from_file(args.policy)
+    router = None
+    if args.route or args.region_meta_key:
+        cidrs = {}
+        for value in args.route:
+            cidr, _, route = value.partition('=')
+            cidrs[cidr] = Route.parse(route)
+        router = Router(
+            ClientPool(),
+            cidrs,
+            region_key=args.region_meta_key,
+            role_key=args.role_meta_key,
+        )
+    worker = Worker(
+        consul,
+        ec2,
+        asg,
+        columnar=args.columnar,
+        journal=journal,
+        cache_ttl=args.cache_ttl,
+        router=router,
+        wait=args.wait,
+        min_interval=args.min_interval,
+        policy=policy,
+    )
+    if args.control:
+        from .control import ControlServer
+        ControlServer(args.control, worker).start()
+    if args.once:
+        summary = worker.reconcile()
+        logger.info(
+            'Reconciled %(nodes)s nodes:  %(resolved)s resolved, '
+            '%(asg_instances)s in an ASG, %(updated)s updated, '
+            '%(unchanged)s unchanged, %(failed)s failed.',
+            summary,
+        )
+        return 1 if summary['failed'] else 0
     worker.run()
@@ -1,4 +1,6 @@
+import sys
+
 from . import main
 
 
-main()
+sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Routing of nodes to per-region and per-account AWS clients.
+
+Each node is assigned a :class:`Route`, either from its Consul node meta or
+from a configured CIDR map, and :class:`ClientPool` hands out one reused pair
+of EC2 and autoscaling clients for every route.
+
+"""
+import ipaddress
+import logging
+from collections import namedtuple
+
+from .decorator import CacheStore
+
+
+logger = logging.getLogger('flatline')
+
+
+class Route(namedtuple('Route', ['region', 'role_arn'])):
+    """
+    Where a node's instance lives.
+
+    :param region:  The AWS region, or ``None`` for the default region.
+    :type region:  str
+    :param role_arn:  An IAM role to assume for the account, or ``None`` to
+    use the default credentials.
+    :type role_arn:  str
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Parse a route from a ``REGION[,ROLE_ARN]`` string.
+
+        """
+        region, _, role_arn = value.partition(',')
+        return cls(region or None, role_arn or None)
+
+    def __str__(self):
+        return '{}/{}'.format(
+            self.region or 'default',
+            self.role_arn or 'default',
+        )
+
+
+DEFAULT_ROUTE = Route(None, None)
+
+
+class ClientPool(object):
+    """
+    Creates EC2 and autoscaling clients for each :class:`Route` and reuses
+    them.  Clients for an assumed role are recreated before the role's
+    credentials expire.
+
+    :param session_duration:  The lifetime, in seconds, of assumed role
+    credentials.
+    :type session_duration:  int
+
+    """
+    #: Recreate assumed role clients this many seconds before they expire.
+    refresh_margin = 300
+
+    def __init__(self, session_duration=3600):
+        self.session_duration = session_duration
+        self.store = CacheStore()
+
+    def clients(self, route):
+        """
+        Get the clients for a route.
+
+        :param route:  The route.
+        :type route:  :class:`Route`
+
+        :returns:  A two-tuple of the EC2 and autoscaling clients.
+
+        """
+        ttl = None
+        if route.role_arn is not None:
+            ttl = self.session_duration - self.refresh_margin
+        return self.store.get(route, lambda: self.create(route), ttl)
+
+    def create(self, route):
+        """
+        Create the clients for a route.
+
+        """
+        import boto3
+        logger.info('Creating AWS clients for %s.', route)
+        session = boto3.Session(region_name=route.region)
+        if route.role_arn is not None:
+            r = session.client('sts').assume_role(
+                RoleArn=route.role_arn,
+                RoleSessionName='flatline',
+                DurationSeconds=self.session_duration,
+            )
+            credentials = r['Credentials']
+            session = boto3.Session(
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken'],
+                region_name=route.region,
+            )
+        return session.client('ec2'), session.client('autoscaling')
+
+
+class Router(object):
+    """
+    Assigns nodes to a :class:`Route`.
+
+    The node meta keys are consulted first, then the CIDR map, with the most
+    specific network winning.  Nodes matching neither get ``default``.
+
+    :param pool:  The pool providing clients for each route.
+    :type pool:  :class:`ClientPool`
+    :param cidrs:  A mapping of CIDR strings to :class:`Route` objects.
+    :type cidrs:  dict
+    :param region_key:  The node meta key holding the region, or ``None`` to
+    ignore node meta.
+    :type region_key:  str
+    :param role_key:  The node meta key holding the role ARN.
+    :type role_key:  str
+    :param default:  The route of unmatched nodes.
+    :type default:  :class:`Route`
+
+    """
+    def __init__(self, pool, cidrs={}, region_key=None,
+                 role_key='aws-role-arn', default=DEFAULT_ROUTE):
+        self.pool = pool
+        self.region_key = region_key
+        self.role_key = role_key
+        self.default = default
+        networks = [
+            (ipaddress.ip_network(cidr), route)
+            for cidr, route in cidrs.items()
+        ]
+        self.networks = sorted(
+            networks,
+            key=lambda x: x[0].prefixlen,
+            reverse=True,
+        )
+
+    def route(self, node):
+        """
+        Find the route for a node.
+
+        :param node:  The node.
+        :type node:  :class:`flatline.Node`
+
+        :rtype:  :class:`Route`
+
+        """
+        if self.region_key is not None:
+            meta = node.meta
+            region = meta.get(self.region_key)
+            if region:
+                return Route(region, meta.get(self.role_key) or None)
+        if self.networks and node.ip is not None:
+            address = ipaddress.ip_address(node.ip)
+            for network, route in self.networks:
+                if address in network:
+                    return route
+        return self.default
+
+    def clients(self, route):
+        """
+        Get the EC2 and autoscaling clients for a route.
+
+        """
+        return self.pool.clients(route)
@@ -0,0 +1,57 @@
+"""
+JSON decoders for Consul responses.
+
+Each decoder accepts the raw response bytes, so no intermediate text copy of
+large payloads is made.  The fastest installed backend is used by default.
+
+"""
+import json
+
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+
+def _load_ujson():
+    import ujson
+    return ujson.loads
+
+
+def _load_json():
+    return json.loads
+
+
+#: Available backends, fastest first.
+BACKENDS = [
+    ('orjson', _load_orjson),
+    ('ujson', _load_ujson),
+    ('json', _load_json),
+]
+
+
+def get_decoder(name='auto'):
+    """
+    Get a JSON decoding function.
+
+    :param name:  The backend name (``orjson``, ``ujson`` or ``json``), or
+    ``auto`` for the fastest one installed.
+    :type name:  str
+
+    :returns:  A two-tuple of the backend name and a function decoding
+    :class:`bytes` to Python objects.
+
+    :raises ValueError:  If the backend is unknown.
+    :raises ImportError:  If a backend was requested by name but is not
+    installed.
+
+    """
+    for backend, load in BACKENDS:
+        if name == 'auto':
+            try:
+                return backend, load()
+            except ImportError:
+                continue
+        elif name == backend:
+            return backend, load()
+    raise ValueError('Unknown JSON decoder {!r}.'.format(name))
@@ -0,0 +1,221 @@
+"""
+A vectorized alternative to :meth:`flatline.Worker.get_nodes`.
+
+Rather than wrapping every check in a :class:`flatline.Check` and grouping
+them in Python, the checks are decoded into flat arrays (node codes, status
+codes and maintenance flags) and per-node health is computed with grouped
+NumPy reductions.  The resulting nodes are indistinguishable from those built
+by the object path.
+
+Requires NumPy.
+
+"""
+from itertools import repeat
+from operator import is_, itemgetter
+
+import numpy as np
+
+from . import Check, Node
+from .decorator import reify
+
+
+#: Status codes.  Anything other than ``passing`` is unhealthy.
+PASSING = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+STATUS_CODES = {
+    'passing': PASSING,
+    'warning': WARNING,
+    'critical': CRITICAL,
+}
+
+
+class CheckColumns(object):
+    """
+    A columnar representation of a set of Consul health checks.
+
+    :param blobs:  The check JSON blobs from Consul.
+    :type blobs:  list
+    :param policy:  If given, checks are judged by the policy rather than by
+    their status alone.
+    :type policy:  :class:`flatline.policy.Policy`
+
+    """
+    def __init__(self, blobs, policy=None):
+        self.blobs = blobs
+        count = len(blobs)
+        # Everything below is driven by ``map`` over C-level callables, so
+        # the per-check work never enters the Python interpreter loop.
+        nodes = list(map(itemgetter('Node'), blobs))
+        self.names = list(dict.fromkeys(nodes))
+        codes = {name: i for i, name in enumerate(self.names)}
+        self.node_codes = np.fromiter(
+            map(codes.__getitem__, nodes), dtype=np.intp, count=count,
+        )
+        self.status_codes = np.fromiter(
+            map(
+                STATUS_CODES.get,
+                map(itemgetter('Status'), blobs),
+                repeat(UNKNOWN),
+            ),
+            dtype=np.int8,
+            count=count,
+        )
+        self.maintenance_flags = np.fromiter(
+            map('_node_maintenance'.__eq__, map(itemgetter('CheckID'), blobs)),
+            dtype=np.bool_,
+            count=count,
+        )
+        if policy is None:
+            self.verdicts = None
+            self.failing_flags = self.status_codes != PASSING
+        else:
+            # Per-check verdicts are cached by the policy, so this is mostly
+            # dictionary lookups.
+            self.verdicts = list(map(policy.verdict, blobs))
+            self.failing_flags = np.fromiter(
+                map(is_, self.verdicts, repeat(False)),
+                dtype=np.bool_,
+                count=count,
+            )
+
+    def __len__(self):
+        return len(self.blobs)
+
+    @reify
+    def healthy(self):
+        """
+        A boolean array, indexed by node code, that is ``True`` if none of
+        the node's checks are failing.
+
+        """
+        failing = np.bincount(
+            self.node_codes,
+            weights=self.failing_flags,
+            minlength=len(self.names),
+        )
+        return failing == 0
+
+    @reify
+    def maintenance(self):
+        """
+        A boolean array, indexed by node code, that is ``True`` if the node is
+        in maintenance mode.
+
+        """
+        flagged = np.bincount(
+            self.node_codes,
+            weights=self.maintenance_flags,
+            minlength=len(self.names),
+        )
+        return flagged > 0
+
+    @reify
+    def groups(self):
+        """
+        The indices of each node's checks, in their original order, indexed by
+        node code.
+
+        """
+        order = np.argsort(self.node_codes, kind='stable')
+        counts = np.bincount(self.node_codes, minlength=len(self.names))
+        return np.split(order, np.cumsum(counts)[:-1])
+
+    def judged_check_ids(self, code):
+        """
+        The IDs of a node's checks not ignored by the policy.
+
+        :param code:  The node code.
+        :type code:  int
+
+        """
+        return [
+            self.blobs[i]['CheckID'] for i in self.groups[code]
+            if self.verdicts is None or self.verdicts[i] is not None
+        ]
+
+    def checks(self, code):
+        """
+        Build the :class:`flatline.Check` objects for a single node.
+
+        :param code:  The node code.
+        :type code:  int
+
+        :returns:  A list of :class:`flatline.Check` objects.
+
+        """
+        return [Check(self.blobs[i]) for i in self.groups[code]]
+
+
+class ColumnarNode(Node):
+    """
+    A :class:`flatline.Node` whose health was computed from
+    :class:`CheckColumns`.  The check objects are only built if
+    :attr:`checks` is accessed.
+
+    """
+    # Shadow the computed properties on :class:`flatline.Node`, so the
+    # precomputed values can be stored on the instance.
+    healthy = None
+    maintenance = None
+
+    def __init__(self, consul, ec2, asg, name, columns, code, healthy,
+                 maintenance, cache=None):
+        self.consul = consul
+        self.ec2 = ec2
+        self.asg = asg
+        self.name = name
+        self.cache = cache
+        self.columns = columns
+        self.code = code
+        self.healthy = healthy
+        self.maintenance = maintenance
+
+    @reify
+    def checks(self):
+        return self.columns.checks(self.code)
+
+
+def get_nodes_columnar(worker):
+    """
+    Query Consul for health checks and group them into nodes, like
+    :meth:`flatline.Worker.get_nodes`.
+
+    :param worker:  The worker to query with.
+    :type worker:  :class:`flatline.Worker`
+
+    :returns:  A dictionary with the node name as keys and a corresponding
+    :class:`ColumnarNode` as values.
+
+    """
+    blobs = worker.get_check_blobs()
+    if not worker.watch.changed and worker.prev_nodes:
+        return worker.prev_nodes
+    policy = worker.policy
+    if policy is not None:
+        policy.begin()
+    columns = CheckColumns(blobs, policy)
+    names = columns.names
+    # Plain lists are much cheaper to index from Python than NumPy arrays.
+    healthy = columns.healthy.tolist()
+    maintenance = columns.maintenance.tolist()
+    nodes = dict()
+    for code in sorted(range(len(names)), key=names.__getitem__):
+        if maintenance[code]:
+            continue
+        name = names[code]
+        nodes[name] = ColumnarNode(
+            worker.consul, worker.ec2, worker.asg, name, columns, code,
+            healthy[code], False, cache=worker.cache,
+        )
+    worker.forget_departed(nodes)
+    if policy is not None and policy.groups:
+        worker.prime_blobs(nodes)
+        for node in nodes.values():
+            if node.healthy and policy.missing(
+                node.meta, columns.judged_check_ids(node.code),
+            ):
+                node.healthy = False
+    return nodes
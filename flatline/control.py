@@ -0,0 +1,206 @@
+"""
+A local control socket for inspecting and steering a running worker.
+
+The server listens on a Unix socket.  Each request is a single line of JSON
+such as ``{"command": "resync", "node": "web-1"}``, and is answered with a
+single line of JSON:  ``{"ok": true, "result": ...}`` or
+``{"ok": false, "error": "..."}``.
+
+Commands:
+
+``dump``
+    The current nodes, their health and cached instance details.
+``resync``
+    Set the ASG health of one ``node``, or of every node in one ``asg``.
+``invalidate``
+    Discard cached details of one ``node``, or of every node.
+``pause`` / ``resume``
+    Stop and restart updating ASG health.
+
+The module can also be run as a client::
+
+    python -m flatline.control /run/flatline.sock resync node=web-1
+
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+
+
+logger = logging.getLogger('flatline')
+
+
+class Control(object):
+    """
+    Executes control commands against a worker.
+
+    :param worker:  The worker to control.
+    :type worker:  :class:`flatline.Worker`
+
+    """
+    def __init__(self, worker):
+        self.worker = worker
+
+    def execute(self, request):
+        """
+        Execute a request.
+
+        :param request:  The decoded request.
+        :type request:  dict
+
+        :returns:  The response.
+        :rtype:  dict
+
+        """
+        command = request.get('command')
+        method = getattr(self, 'do_{}'.format(command), None)
+        if method is None:
+            return {'ok': False, 'error': 'Unknown command {!r}.'.format(
+                command,
+            )}
+        try:
+            return {'ok': True, 'result': method(request)}
+        except Exception as e:
+            logger.exception('Control command %s failed.', command)
+            return {'ok': False, 'error': str(e)}
+
+    def do_dump(self, request):
+        return self.worker.describe()
+
+    def do_resync(self, request):
+        if 'node' in request:
+            if request['node'] not in self.worker.prev_nodes:
+                raise ValueError('Unknown node {!r}.'.format(request['node']))
+            node = self.worker.resync_node(request['node'])
+            return {'node': node.name, 'healthy': node.healthy}
+        if 'asg' in request:
+            return self.worker.resync_asg(request['asg'])
+        raise ValueError('resync requires a node or asg.')
+
+    def do_invalidate(self, request):
+        return {'invalidated': self.worker.invalidate(request.get('node'))}
+
+    def do_pause(self, request):
+        self.worker.pause()
+        return {'paused': True}
+
+    def do_resume(self, request):
+        return {'paused': False, 'dispatched': self.worker.resume()}
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a connection to the control socket, answering each line.
+
+    """
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError('Request must be an object.')
+            except ValueError as e:
+                response = {'ok': False, 'error': str(e)}
+            else:
+                response = self.server.control.execute(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class ControlServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    Serves the control socket.  Only the owner may connect.
+
+    :param path:  The path of the Unix socket.  An existing socket at this
+    path is replaced.
+    :type path:  str
+    :param worker:  The worker to control.
+    :type worker:  :class:`flatline.Worker`
+
+    """
+    daemon_threads = True
+
+    def __init__(self, path, worker):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        self.path = path
+        self.control = Control(worker)
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, ControlHandler)
+        finally:
+            os.umask(old_umask)
+
+    def start(self):
+        """
+        Serve in a daemon thread.
+
+        """
+        thread = threading.Thread(
+            target=self.serve_forever,
+            name='flatline-control',
+        )
+        thread.daemon = True
+        thread.start()
+        logger.info('Control socket listening on %s.', self.path)
+        return thread
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def send(path, request):
+    """
+    Send a request to a control socket.
+
+    :param path:  The path of the Unix socket.
+    :type path:  str
+    :param request:  The request.
+    :type request:  dict
+
+    :returns:  The response.
+    :rtype:  dict
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        fh = sock.makefile('rb')
+        return json.loads(fh.readline().decode('utf-8'))
+    finally:
+        sock.close()
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) < 2:
+        sys.stderr.write(
+            'Usage:  python -m flatline.control SOCKET COMMAND '
+            '[KEY=VALUE]...\n'
+        )
+        return 2
+    request = {'command': argv[1]}
+    for arg in argv[2:]:
+        key, _, value = arg.partition('=')
+        request[key] = value
+    response = send(argv[0], request)
+    json.dump(response, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0 if response['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
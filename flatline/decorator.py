@@ -38,9 +38,14 @@ TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
 THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 SUCH DAMAGE.
 
+Changed 2026-10-19:  :class:`CacheStore` and :class:`cached` were added for
+flatline and are not part of Pyramid.
+
 """
 
+import threading
 from functools import update_wrapper
+from time import monotonic
 
 
 class reify(object):
@@ -87,3 +92,235 @@ class reify(object):
         val = self.wrapped(inst)
         setattr(inst, self.wrapped.__name__, val)
         return val
+
+
+class CacheStore(object):
+    """ A thread-safe store of cached values, with optional expiry.
+
+    Values are computed with single-flight semantics:  if several threads ask
+    for the same missing key at once, one of them computes it while the others
+    wait for its result.
+
+    Expired entries are swept out as new values are stored, so keys that are
+    never read again don't accumulate.
+
+    :param ttl:  The default number of seconds a value is kept, or ``None`` to
+    keep values until they are invalidated.
+    :type ttl:  float
+    :param negative_ttl:  If given, ``None`` values are kept for at most this
+    many seconds, so failed lookups are retried sooner.
+    :type negative_ttl:  float
+    :param clock:  A function returning the current time in seconds.
+
+    """
+    def __init__(self, ttl=None, negative_ttl=None, clock=monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._next_sweep = None
+        self._inflight = {}
+        # In-flight keys invalidated since their computation started.
+        self._invalidated = set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _lookup(self, key):
+        # Must be called with the lock held.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires = entry[1]
+        if expires is not None and expires <= self.clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def keys(self):
+        """ The keys of all unexpired entries. """
+        with self._lock:
+            return [key for key in list(self._entries) if self._lookup(key)]
+
+    def peek(self, key, default=None):
+        """ Return the cached value for ``key`` without computing it. """
+        with self._lock:
+            entry = self._lookup(key)
+        return default if entry is None else entry[0]
+
+    def get(self, key, compute, ttl=None):
+        """ Return the cached value for ``key``, calling ``compute`` to
+        produce it if it is missing or expired.
+
+        :param key:  The cache key.
+        :param compute:  A function of no arguments that returns the value.
+        :param ttl:  Overrides the store's default TTL for this value.
+        :type ttl:  float
+
+        """
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry[0]
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = threading.Lock()
+                    flight.acquire()
+            if not leader:
+                # Wait for the leader to finish, then look again.  If the
+                # leader failed, one of the waiters will take over.
+                with flight:
+                    pass
+                continue
+            try:
+                value = compute()
+                with self._lock:
+                    # Don't resurrect a value invalidated mid-computation.
+                    if key not in self._invalidated:
+                        self._store(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                    self._invalidated.discard(key)
+                flight.release()
+
+    def _store(self, key, value, ttl):
+        # Must be called with the lock held.
+        if ttl is None:
+            ttl = self.ttl
+        if value is None and self.negative_ttl is not None:
+            ttl = self.negative_ttl if ttl is None else min(
+                ttl, self.negative_ttl,
+            )
+        if ttl is None:
+            self._entries[key] = (value, None)
+            return
+        now = self.clock()
+        if self._next_sweep is not None and self._next_sweep <= now:
+            self._sweep(now)
+        if self._next_sweep is None:
+            self._next_sweep = now + ttl
+        self._entries[key] = (value, now + ttl)
+
+    def _sweep(self, now):
+        # Must be called with the lock held.  Sweeping at most once per TTL
+        # keeps the cost proportional to the number of writes.
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if entry[1] is None or entry[1] > now
+        }
+        self._next_sweep = None
+
+    def set(self, key, value, ttl=None):
+        """ Store a value, replacing any existing one. """
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def invalidate(self, *keys):
+        """ Remove the given keys, or every key if none are given. """
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                self._invalidated.update(self._inflight)
+            for key in keys:
+                self._entries.pop(key, None)
+                if key in self._inflight:
+                    self._invalidated.add(key)
+
+
+_instance_store_lock = threading.Lock()
+
+
+class cached(object):
+    """ Use as a class method decorator.  Like :class:`reify`, it caches the
+    result of the method it decorates, but it is thread-safe, the value can
+    expire and be invalidated, and it can be kept in a shared
+    :class:`CacheStore` so that it outlives the instance.
+
+    It may be used bare or with arguments:
+
+    .. doctest::
+
+        >>> class Foo(object):
+        ...     def __init__(self, name, cache=None):
+        ...         self.name = name
+        ...         self.cache = cache
+        ...     @cached(ttl=60, key=lambda self: self.name, store='cache')
+        ...     def jammy(self):
+        ...         print('jammy called')
+        ...         return 1
+        >>> shared = CacheStore()
+        >>> Foo('a', shared).jammy
+        jammy called
+        1
+        >>> Foo('a', shared).jammy
+        1
+        >>> f = Foo('a', shared)
+        >>> Foo.jammy.invalidate(f)
+        >>> f.jammy
+        jammy called
+        1
+
+    :param ttl:  The number of seconds the value is kept.  Defaults to the
+    store's TTL.
+    :type ttl:  float
+    :param key:  A function of the instance returning the key used in a shared
+    store.  Required if ``store`` is given.
+    :param store:  The name of an instance attribute holding a shared
+    :class:`CacheStore`.  If the attribute is ``None``, or ``store`` is not
+    given, a private store on the instance is used instead.
+    :type store:  str
+
+    """
+    def __init__(self, wrapped=None, ttl=None, key=None, store=None):
+        self.ttl = ttl
+        self.key = key
+        self.store = store
+        if wrapped is not None:
+            self._wrap(wrapped)
+
+    def _wrap(self, wrapped):
+        self.wrapped = wrapped
+        self.name = wrapped.__name__
+        update_wrapper(self, wrapped)
+        return self
+
+    def __call__(self, wrapped):
+        return self._wrap(wrapped)
+
+    def _locate(self, inst):
+        """ Return the store and key for an instance. """
+        if self.store is not None:
+            store = getattr(inst, self.store, None)
+            if store is not None:
+                return store, (self.name, self.key(inst))
+        store = inst.__dict__.get('_cached_store')
+        if store is None:
+            with _instance_store_lock:
+                store = inst.__dict__.setdefault(
+                    '_cached_store', CacheStore(),
+                )
+        return store, self.name
+
+    def __get__(self, inst, objtype=None):
+        if inst is None:
+            return self
+        store, key = self._locate(inst)
+        return store.get(key, lambda: self.wrapped(inst), self.ttl)
+
+    def __set__(self, inst, value):
+        store, key = self._locate(inst)
+        store.set(key, value, self.ttl)
+
+    def __delete__(self, inst):
+        self.invalidate(inst)
+
+    def invalidate(self, inst):
+        """ Discard the cached value for an instance. """
+        store, key = self._locate(inst)
+        store.invalidate(key)
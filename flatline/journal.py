@@ -0,0 +1,186 @@
+"""
+A structured journal of node health transitions.
+
+Each transition is written as a single JSON object per line to a rotating
+file, along with the timestamps needed to measure how long a Consul health
+change takes to reach the ASG.
+
+"""
+import json
+import logging
+import math
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+
+class LatencyTracker(object):
+    """
+    Keeps a rolling window of latency samples and summarizes them as
+    percentiles.
+
+    :param window:  The number of most recent samples to keep.
+    :type window:  int
+
+    """
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, value):
+        """
+        Record a latency sample.
+
+        :param value:  The latency, in seconds.
+        :type value:  float
+
+        """
+        self.samples.append(value)
+        self.total += 1
+
+    def percentile(self, p):
+        """
+        Compute a percentile of the current window using the nearest-rank
+        method.
+
+        :param p:  The percentile, between 0 and 100.
+        :type p:  float
+
+        :returns:  The latency, or ``None`` if there are no samples.
+        :rtype:  float
+
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = int(math.ceil(p / 100.0 * len(ordered)))
+        return ordered[max(rank, 1) - 1]
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Summarize the current window.
+
+        :param percentiles:  The percentiles to include.
+        :type percentiles:  tuple
+
+        :returns:  A dictionary with the sample counts and a ``pNN`` key for
+        each percentile.
+        :rtype:  dict
+
+        """
+        summary = {
+            'window': len(self.samples),
+            'total': self.total,
+        }
+        for p in percentiles:
+            summary['p{}'.format(p)] = self.percentile(p)
+        if self.samples:
+            summary['max'] = max(self.samples)
+        else:
+            summary['max'] = None
+        return summary
+
+
+class Journal(object):
+    """
+    Writes node transitions as JSON lines to a rotating file.
+
+    :param path:  The path of the journal file.
+    :type path:  str
+    :param max_bytes:  The size at which the file is rotated.
+    :type max_bytes:  int
+    :param backup_count:  The number of rotated files to keep.
+    :type backup_count:  int
+    :param window:  The number of samples used for latency percentiles.
+    :type window:  int
+
+    """
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 window=1000):
+        self.path = path
+        self.latency = LatencyTracker(window)
+        self._lock = threading.Lock()
+        # A private logger, so journal lines never reach the root handlers.
+        self.logger = logging.Logger('flatline.journal')
+        self.logger.propagate = False
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+
+    def write(self, event, **fields):
+        """
+        Write a single event to the journal.
+
+        :param event:  The event type.
+        :type event:  str
+
+        """
+        fields['event'] = event
+        self.logger.info(json.dumps(fields, sort_keys=True))
+
+    def record(self, node, healthy, index, observed_at, instance_id=None,
+               resolved_at=None, sent_at=None, acked_at=None,
+               event='transition'):
+        """
+        Record a node transition.  If the ASG acknowledged the new health,
+        the time since the Consul index was observed is added to the
+        propagation latency.
+
+        Other events, such as manual resyncs, are recorded without affecting
+        the latency.
+
+        :param node:  The node name.
+        :type node:  str
+        :param healthy:  The new health of the node.
+        :type healthy:  bool
+        :param index:  The Consul index the transition was observed at.
+        :type index:  str
+        :param observed_at:  When the Consul index was observed.
+        :type observed_at:  float
+        :param instance_id:  The EC2 instance ID, if resolved.
+        :type instance_id:  str
+        :param resolved_at:  When the instance ID was resolved.
+        :type resolved_at:  float
+        :param sent_at:  When ``set_instance_health`` was sent.
+        :type sent_at:  float
+        :param acked_at:  When ``set_instance_health`` returned.
+        :type acked_at:  float
+        :param event:  The event type.
+        :type event:  str
+
+        """
+        latency = None
+        if (event == 'transition' and acked_at is not None and
+                observed_at is not None):
+            latency = acked_at - observed_at
+            with self._lock:
+                self.latency.add(latency)
+        self.write(
+            event,
+            node=node,
+            healthy=healthy,
+            index=index,
+            observed_at=observed_at,
+            instance_id=instance_id,
+            resolved_at=resolved_at,
+            sent_at=sent_at,
+            acked_at=acked_at,
+            latency=latency,
+        )
+
+    def write_summary(self):
+        """
+        Write the rolling propagation latency percentiles to the journal.
+
+        :returns:  The summary.
+        :rtype:  dict
+
+        """
+        with self._lock:
+            summary = self.latency.summary()
+        self.write('summary', **summary)
+        return summary
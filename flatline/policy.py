@@ -0,0 +1,262 @@
+"""
+Declarative health policies.
+
+By default a node is healthy if all of its checks are ``passing``.  A policy
+changes how checks are judged, and is loaded from JSON such as::
+
+    {
+        "rules": [
+            {"check": "service:batch-*", "ignore": true},
+            {"service": "web", "status": {"warning": "passing"}}
+        ],
+        "groups": [
+            {
+                "meta": {"role": "web"},
+                "required": ["serfHealth", "service:web*"]
+            }
+        ]
+    }
+
+Each rule may match on a ``check`` ID glob and a ``service`` name glob.  The
+first rule matching a check applies:  it is either ignored, or its status is
+mapped before being judged.  Checks matching no rule are judged as-is.
+
+Each group matches nodes by node meta globs.  A node in a group is unhealthy
+unless every ``required`` glob matches at least one of its non-ignored checks.
+
+Globs are compiled to regular expressions once, and the verdict for each check
+is cached until its ``ModifyIndex`` changes.
+
+"""
+import json
+import re
+from fnmatch import translate
+
+
+STATUSES = ('passing', 'warning', 'critical')
+
+_MISSING = object()
+
+
+def compile_glob(pattern):
+    """
+    Compile a case-sensitive glob to a matching function.
+
+    """
+    return re.compile(translate(pattern)).match
+
+
+class Rule(object):
+    """
+    A rule adjusting how matching checks are judged.
+
+    :param check:  A glob matched against the check ID.
+    :type check:  str
+    :param service:  A glob matched against the service name.
+    :type service:  str
+    :param ignore:  If ``True``, matching checks don't affect node health.
+    :type ignore:  bool
+    :param status:  A mapping of Consul statuses to the status to judge
+    matching checks by.
+    :type status:  dict
+
+    """
+    def __init__(self, check=None, service=None, ignore=False, status={}):
+        for key, value in status.items():
+            for name in (key, value):
+                if name not in STATUSES:
+                    raise ValueError('Unknown status {!r}.'.format(name))
+        self.match_check = None if check is None else compile_glob(check)
+        self.match_service = (
+            None if service is None else compile_glob(service)
+        )
+        self.ignore = ignore
+        self.status = dict(status)
+
+    def matches(self, check_id, service):
+        if self.match_check is not None and not self.match_check(check_id):
+            return False
+        if self.match_service is not None and not self.match_service(service):
+            return False
+        return True
+
+
+class Group(object):
+    """
+    A set of checks required on nodes with matching node meta.
+
+    :param meta:  A mapping of node meta keys to value globs.
+    :type meta:  dict
+    :param required:  Globs that must each match a non-ignored check ID.
+    :type required:  list
+
+    """
+    def __init__(self, meta, required):
+        self.meta = [
+            (key, compile_glob(value)) for key, value in meta.items()
+        ]
+        self.required = [
+            (pattern, compile_glob(pattern)) for pattern in required
+        ]
+
+    def matches(self, meta):
+        for key, match in self.meta:
+            value = meta.get(key)
+            if value is None or not match(value):
+                return False
+        return True
+
+
+class Policy(object):
+    """
+    A compiled health policy.
+
+    :param rules:  The check rules, in order of precedence.
+    :type rules:  list of :class:`Rule`
+    :param groups:  The required check groups.
+    :type groups:  list of :class:`Group`
+
+    """
+    def __init__(self, rules=(), groups=()):
+        self.rules = list(rules)
+        self.groups = list(groups)
+        self._cache = {}
+        self._prev = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from its decoded JSON configuration.
+
+        :raises ValueError:  If the configuration is invalid.
+
+        """
+        unknown = set(config) - {'rules', 'groups'}
+        if unknown:
+            raise ValueError('Unknown policy keys:  {}'.format(
+                ', '.join(sorted(unknown)),
+            ))
+        try:
+            rules = [Rule(**rule) for rule in config.get('rules', [])]
+            groups = [Group(**group) for group in config.get('groups', [])]
+        except TypeError as e:
+            raise ValueError('Invalid policy:  {}'.format(e))
+        return cls(rules, groups)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a policy from a JSON file.
+
+        """
+        with open(path) as fh:
+            return cls.from_config(json.load(fh))
+
+    def begin(self):
+        """
+        Start a new cycle.  Cached verdicts of checks not seen since the
+        previous cycle are dropped.
+
+        """
+        self._prev = self._cache
+        self._cache = {}
+
+    def judge(self, check_id, service, status):
+        """
+        Judge a check, without caching.
+
+        :returns:  ``True`` if passing, ``False`` if failing, or ``None`` if
+        ignored.
+
+        """
+        for rule in self.rules:
+            if rule.matches(check_id, service):
+                if rule.ignore:
+                    return None
+                return rule.status.get(status, status) == 'passing'
+        return status == 'passing'
+
+    def verdict(self, blob):
+        """
+        Judge a check, reusing the previous verdict if its ``ModifyIndex`` is
+        unchanged.
+
+        :param blob:  The check JSON blob from Consul.
+        :type blob:  dict
+
+        :returns:  ``True`` if passing, ``False`` if failing, or ``None`` if
+        ignored.
+
+        """
+        try:
+            key = (blob['Node'], blob['CheckID'], blob['ModifyIndex'])
+        except KeyError:
+            return self.judge(
+                blob['CheckID'], blob.get('ServiceName', ''), blob['Status'],
+            )
+        verdict = self._cache.get(key, _MISSING)
+        if verdict is _MISSING:
+            verdict = self._prev.get(key, _MISSING)
+            if verdict is _MISSING:
+                verdict = self.judge(
+                    blob['CheckID'],
+                    blob.get('ServiceName', ''),
+                    blob['Status'],
+                )
+            self._cache[key] = verdict
+        return verdict
+
+    def required(self, meta):
+        """
+        The required check globs for a node.
+
+        :param meta:  The node meta.
+        :type meta:  dict
+
+        :returns:  A list of ``(pattern, match)`` tuples.
+
+        """
+        required = []
+        for group in self.groups:
+            if group.matches(meta):
+                required.extend(group.required)
+        return required
+
+    def missing(self, meta, check_ids):
+        """
+        Find the required checks a node lacks.
+
+        :param meta:  The node meta.
+        :type meta:  dict
+        :param check_ids:  The IDs of the node's non-ignored checks.
+        :type check_ids:  list
+
+        :returns:  The globs matching none of the checks.
+        :rtype:  list
+
+        """
+        return [
+            pattern for pattern, match in self.required(meta)
+            if not any(match(id) for id in check_ids)
+        ]
+
+    def healthy(self, node):
+        """
+        Judge a node.
+
+        :param node:  The node.
+        :type node:  :class:`flatline.Node`
+
+        :rtype:  bool
+
+        """
+        present = []
+        for check in node.checks:
+            verdict = self.verdict(check.blob)
+            if verdict is False:
+                return False
+            if verdict is not None:
+                present.append(check.id)
+        if self.groups and self.missing(node.meta, present):
+            return False
+        return True
@@ -0,0 +1,181 @@
+"""
+Blocking queries against the Consul HTTP API.
+
+:class:`Watch` follows the client guidance in the Consul documentation:  the
+index is reset if it goes backwards or is not positive, wakeups are rate
+limited, and the ``wait`` is jittered so many watchers don't wake in lockstep.
+
+"""
+import logging
+import random
+from time import monotonic, sleep
+
+
+logger = logging.getLogger('flatline')
+
+
+def parse_index(index):
+    """
+    Parse an ``X-Consul-Index`` header.
+
+    :returns:  The index as an integer, or ``None`` if it is missing or
+    malformed.
+
+    """
+    try:
+        return int(index)
+    except (TypeError, ValueError):
+        return None
+
+
+class Watch(object):
+    """
+    Repeatedly runs a blocking query against a Consul endpoint.
+
+    :param consul:  The Consul client.
+    :type consul:  :class:`flatline.Consul`
+    :param path:  The path to query, e.g. ``v1/health/state/any``.
+    :type path:  str
+    :param params:  Additional URL parameters to send.
+    :type params:  dict
+    :param wait:  The number of seconds Consul may block for.
+    :type wait:  int
+    :param jitter:  Up to this fraction of ``wait`` is randomly added to each
+    query.
+    :type jitter:  float
+    :param min_interval:  The minimum number of seconds between wakeups.
+    :type min_interval:  float
+
+    """
+    #: The index of the last response, as returned by Consul.
+    index = None
+
+    #: ``True`` if the last response had a different index than the one
+    #: before it.
+    changed = True
+
+    def __init__(self, consul, path, params={}, wait=60, jitter=1 / 16.0,
+                 min_interval=1.0):
+        self.consul = consul
+        self.path = path
+        self.params = params
+        self.wait = wait
+        self.jitter = jitter
+        self.min_interval = min_interval
+        self.clock = monotonic
+        self.sleep = sleep
+        self.random = random.random
+        self.last_wakeup = None
+        self.wakeups = 0
+        self.spurious_wakeups = 0
+        self.resets = 0
+
+    def stats(self):
+        """
+        Counters describing the watch's behavior.
+
+        :rtype:  dict
+
+        """
+        return {
+            'index': self.index,
+            'wakeups': self.wakeups,
+            'spurious_wakeups': self.spurious_wakeups,
+            'resets': self.resets,
+        }
+
+    def reset(self):
+        """
+        Forget the index, so the next query returns immediately with the
+        current state.
+
+        """
+        self.index = None
+
+    def throttle(self):
+        """
+        Sleep until at least :attr:`min_interval` has passed since the last
+        wakeup.
+
+        """
+        if self.last_wakeup is None:
+            return
+        remaining = self.min_interval - (self.clock() - self.last_wakeup)
+        if remaining > 0:
+            logger.debug('Throttling Consul watch for %.2fs.', remaining)
+            self.sleep(remaining)
+
+    def wait_param(self):
+        """
+        The jittered ``wait`` parameter for the next query.
+
+        """
+        wait = self.wait + int(self.random() * self.wait * self.jitter)
+        return '{}s'.format(wait)
+
+    def timeout(self):
+        """
+        The HTTP timeout for a blocking query.  Consul adds up to ``wait / 16``
+        of its own jitter, on top of ours.
+
+        """
+        return self.wait * (1 + self.jitter) * (1 + 1 / 16.0) + 10
+
+    def poll(self):
+        """
+        Query Consul, blocking until the result changes or ``wait`` expires.
+
+        :returns:  The decoded response body.
+
+        """
+        self.throttle()
+        params = dict(self.params)
+        kwargs = {}
+        if self.index is not None:
+            params['wait'] = self.wait_param()
+            params['index'] = self.index
+            kwargs['timeout'] = self.timeout()
+        started = self.clock()
+        r, index = self.consul.get(self.path, params, **kwargs)
+        self.last_wakeup = self.clock()
+        self.wakeups += 1
+        self.update_index(index, self.last_wakeup - started)
+        return r
+
+    def update_index(self, index, elapsed=0):
+        """
+        Store the index of a response, resetting or correcting it if it is not
+        sane.
+
+        :param index:  The ``X-Consul-Index`` header.
+        :type index:  str
+        :param elapsed:  How long the query blocked for, in seconds.
+        :type elapsed:  float
+
+        """
+        prev = parse_index(self.index)
+        new = parse_index(index)
+        if new is None or new < 1:
+            # Blocking on index 0 returns immediately, so never store it.
+            # Without a usable index there's no telling whether the response
+            # differs from the last one, so assume it does.
+            logger.warning('Consul returned an invalid index %r.', index)
+            self.resets += 1
+            index = '1'
+            new = 1
+            prev = None
+        elif prev is not None and new < prev:
+            # e.g. after a snapshot restore.  The response is still the
+            # current state, so start over from its index.
+            logger.warning(
+                'Consul index went backwards (%s to %s), resetting.',
+                prev,
+                new,
+            )
+            self.resets += 1
+            prev = None
+        self.changed = new != prev
+        if prev is not None and not self.changed and elapsed < self.wait:
+            logger.debug('Spurious wakeup of Consul watch at %s.', index)
+            self.spurious_wakeups += 1
+        self.index = index
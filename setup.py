@@ -16,6 +16,10 @@ setup(
         'requests>=2,<3',
         'boto3>=1,<2',
     ],
+    extras_require={
+        'columnar': ['numpy'],
+        'fast-json': ['orjson'],
+    },
     packages=['flatline'],
     entry_points={
         'console_scripts': ['flatline=flatline:main'],
@@ -2,6 +2,7 @@ import pytest
 from datetime import datetime as DateTime
 from collections import namedtuple
 import json
+import sys
 from mock import Mock
 from flatline import *
 
@@ -72,11 +73,12 @@ def test_get_checks_warm():
     consul.call = Mock(return_value=([], '13'))
     worker = Worker(consul, None, None)
     worker.last_index = '12'
+    worker.watch.random = lambda: 0.0  # No jitter
     assert worker.get_checks() == []
     consul.call.assert_called_once_with('GET', 'v1/health/state/any', {
         'wait': '60s',
         'index': '12'
-    })
+    }, timeout=worker.watch.timeout())
     worker.last_index = '13'
 
 
@@ -428,3 +430,880 @@ def test_update_healthg(monkeypatch):
     diff_nodes.assert_called_once_with('prevnodes', 'mynodes')
     node1.update_instance_health.assert_called_once_with()
     node2.update_instance_health.assert_not_called()
+
+
+def _check_blob(node, id, status):
+    return {
+        "Node": node,
+        "CheckID": id,
+        "Name": id,
+        "Status": status,
+        "Notes": "",
+        "Output": "",
+        "ServiceID": "",
+        "ServiceName": ""
+    }
+
+
+def test_get_nodes_columnar(monkeypatch):
+    pytest.importorskip('numpy')
+    blobs = [
+        _check_blob('healthy', 'serfHealth', 'passing'),
+        _check_blob('unhealthy', 'serfHealth', 'passing'),
+        _check_blob('warning', 'serfHealth', 'warning'),
+        _check_blob('healthy', 'service:redis', 'passing'),
+        _check_blob('unhealthy', 'service:redis', 'critical'),
+        _check_blob('maint', 'serfHealth', 'passing'),
+        _check_blob('maint', '_node_maintenance', 'critical'),
+        _check_blob('unknown', 'serfHealth', 'bogus'),
+    ]
+    monkeypatch.setattr(Worker, 'get_check_blobs', lambda _: blobs)
+    expected = Worker('consul', 'ec2', 'asg').get_nodes()
+    nodes = Worker('consul', 'ec2', 'asg', columnar=True).get_nodes()
+    assert list(nodes) == list(expected)
+    for name, node in nodes.items():
+        assert node.name == name
+        assert node.healthy is expected[name].healthy
+        assert node.maintenance is False
+        assert node.checks == expected[name].checks
+        assert node.consul == 'consul'
+        assert node.ec2 == 'ec2'
+        assert node.asg == 'asg'
+    assert nodes['healthy'].healthy is True
+    assert nodes['unhealthy'].healthy is False
+
+
+def test_parse_args_json_decoder(monkeypatch):
+    assert parse_args(['--json-decoder', 'json']).json_decoder == 'json'
+    monkeypatch.setitem(sys.modules, 'ujson', None)
+    with pytest.raises(SystemExit):
+        parse_args(['--json-decoder', 'ujson'])
+
+
+def test_parse_args_columnar(monkeypatch):
+    assert parse_args([]).columnar is False
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    with pytest.raises(SystemExit):
+        parse_args(['--columnar'])
+
+
+def test_latency_tracker():
+    from flatline.journal import LatencyTracker
+    tracker = LatencyTracker(window=4)
+    assert tracker.percentile(50) is None
+    for value in [10.0, 1.0, 2.0, 3.0, 4.0]:
+        tracker.add(value)
+    assert tracker.percentile(50) == 2.0
+    assert tracker.percentile(99) == 4.0
+    assert tracker.summary() == {
+        'window': 4,
+        'total': 5,
+        'p50': 2.0,
+        'p90': 4.0,
+        'p99': 4.0,
+        'max': 4.0,
+    }
+
+
+def test_update_health_journal(monkeypatch, tmpdir):
+    path = str(tmpdir.join('journal.log'))
+    node1 = Mock(is_asg_instance=True, instance_id='i-1234', healthy=True)
+    node1.name = 'node1'
+    node2 = Mock(is_asg_instance=False, instance_id=None, healthy=False)
+    node2.name = 'node2'
+    monkeypatch.setattr(Worker, 'get_nodes', Mock(return_value={}))
+    monkeypatch.setattr(
+        Worker, 'diff_nodes', Mock(return_value=[node1, node2]),
+    )
+    worker = Worker(None, None, None, journal=Journal(path))
+    worker.last_index = '12'
+    worker.last_observed = 1000.0
+    worker.update_health()
+    node1.update_instance_health.assert_called_once_with()
+    node2.update_instance_health.assert_not_called()
+
+    with open(path) as fh:
+        events = [json.loads(line) for line in fh]
+    assert [e['event'] for e in events] == [
+        'transition', 'transition', 'summary',
+    ]
+    assert events[0]['node'] == 'node1'
+    assert events[0]['index'] == '12'
+    assert events[0]['instance_id'] == 'i-1234'
+    assert events[0]['observed_at'] == 1000.0
+    assert (
+        events[0]['resolved_at'] <= events[0]['sent_at'] <=
+        events[0]['acked_at']
+    )
+    assert events[0]['latency'] == events[0]['acked_at'] - 1000.0
+    assert events[1]['node'] == 'node2'
+    assert events[1]['healthy'] is False
+    assert events[1]['sent_at'] is None
+    assert events[1]['latency'] is None
+    assert events[2]['total'] == 1
+
+
+def test_lazy_client(monkeypatch):
+    import boto3
+    client = Mock()
+    create = Mock(return_value=client)
+    monkeypatch.setattr(boto3, 'client', create)
+    lazy = LazyClient('ec2', region_name='us-west-2')
+    create.assert_not_called()
+    lazy.describe_instances(Filters=[])
+    lazy.describe_instances(Filters=[])
+    create.assert_called_once_with('ec2', region_name='us-west-2')
+    assert client.describe_instances.call_count == 2
+
+
+def test_reconcile(monkeypatch):
+    checks = [
+        MockCheck('healthy', '1', True),
+        MockCheck('unhealthy', '1', False),
+        MockCheck('unchanged', '1', True),
+        MockCheck('no-asg', '1', False),
+        MockCheck('no-instance', '1', False),
+        MockCheck('no-address', '1', False),
+    ]
+    monkeypatch.setattr(Worker, 'get_checks', lambda _: checks)
+    consul = Consul()
+    consul.call = Mock(return_value=([
+        {'Node': 'healthy', 'Address': '10.0.0.1'},
+        {'Node': 'unhealthy', 'Address': '10.0.0.2'},
+        {'Node': 'unchanged', 'Address': '10.0.0.3'},
+        {'Node': 'no-asg', 'Address': '10.0.0.4'},
+        {'Node': 'no-instance', 'Address': '10.0.0.5'},
+    ], '12'))
+    ec2 = Mock()
+    ec2.get_paginator.return_value.paginate.return_value = [
+        {'Reservations': [{'Instances': [
+            {'InstanceId': 'i-1', 'PrivateIpAddress': '10.0.0.1'},
+            {'InstanceId': 'i-2', 'PrivateIpAddress': '10.0.0.2'},
+        ]}]},
+        {'Reservations': [{'Instances': [
+            {
+                'InstanceId': 'i-3',
+                'PrivateIpAddress': '10.0.9.9',
+                'NetworkInterfaces': [{
+                    'PrivateIpAddresses': [
+                        {'PrivateIpAddress': '10.0.9.9'},
+                        {'PrivateIpAddress': '10.0.0.3'},
+                    ],
+                }],
+            },
+            {'InstanceId': 'i-4', 'PrivateIpAddress': '10.0.0.4'},
+        ]}]},
+    ]
+    asg = Mock()
+    asg.describe_auto_scaling_instances.return_value = {
+        'AutoScalingInstances': [
+            {
+                'InstanceId': 'i-1',
+                'AutoScalingGroupName': 'web',
+                'HealthStatus': 'UNHEALTHY',
+            },
+            {
+                'InstanceId': 'i-2',
+                'AutoScalingGroupName': 'web',
+                'HealthStatus': 'HEALTHY',
+            },
+            {
+                'InstanceId': 'i-3',
+                'AutoScalingGroupName': 'db',
+                'HealthStatus': 'HEALTHY',
+            },
+        ],
+    }
+    worker = Worker(consul, ec2, asg)
+    summary = worker.reconcile()
+    assert summary == {
+        'nodes': 6,
+        'resolved': 4,
+        'asg_instances': 3,
+        'updated': 2,
+        'unchanged': 1,
+        'failed': 0,
+    }
+    consul.call.assert_called_once_with('GET', 'v1/catalog/nodes', {})
+    ec2.describe_instances.assert_not_called()
+    ips = ec2.get_paginator.return_value.paginate.call_args[1]
+    assert set(ips['Filters'][0]['Values']) == {
+        '10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5',
+    }
+    ids = asg.describe_auto_scaling_instances.call_args[1]['InstanceIds']
+    assert set(ids) == {'i-1', 'i-2', 'i-3', 'i-4'}
+    assert sorted(
+        (call[1] for call in asg.set_instance_health.call_args_list),
+        key=lambda x: x['InstanceId'],
+    ) == [
+        {'InstanceId': 'i-1', 'HealthStatus': 'Healthy'},
+        {'InstanceId': 'i-2', 'HealthStatus': 'Unhealthy'},
+    ]
+    assert worker.prev_nodes['no-asg'].is_asg_instance is False
+    assert worker.prev_nodes['unchanged'].asg_name == 'db'
+    assert worker.prev_nodes['no-instance'].instance_id is None
+    assert worker.prev_nodes['no-address'].instance_id is None
+
+
+def test_cache_store_ttl():
+    from flatline.decorator import CacheStore
+    now = [0.0]
+    store = CacheStore(ttl=10, clock=lambda: now[0])
+    compute = Mock(side_effect=[1, 2, 3])
+    assert store.get('a', compute) == 1
+    now[0] = 9.0
+    assert store.get('a', compute) == 1
+    now[0] = 10.0
+    assert store.get('a', compute) == 2
+    store.invalidate('a')
+    assert store.get('a', compute) == 3
+    assert store.keys() == ['a']
+    store.invalidate()
+    assert len(store) == 0
+
+
+def test_cache_store_single_flight():
+    import threading
+    from flatline.decorator import CacheStore
+    store = CacheStore()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+
+    def target():
+        results.append(store.get('k', compute))
+
+    threads = [threading.Thread(target=target) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert results == ['value'] * 8
+
+
+def test_cache_store_leader_failure():
+    from flatline.decorator import CacheStore
+    store = CacheStore()
+    with pytest.raises(ValueError):
+        store.get('k', Mock(side_effect=ValueError))
+    assert store.get('k', lambda: 'ok') == 'ok'
+
+
+def test_cache_store_invalidate_in_flight():
+    from flatline.decorator import CacheStore
+    store = CacheStore()
+
+    def compute_a():
+        store.invalidate('b')
+        return 'a'
+
+    def compute_b():
+        store.invalidate('b')
+        return 'b'
+
+    compute = Mock(side_effect=compute_a)
+    assert store.get('a', compute) == 'a'
+    assert store.get('a', compute) == 'a'
+    assert compute.call_count == 1
+    compute = Mock(side_effect=compute_b)
+    assert store.get('b', compute) == 'b'
+    assert store.get('b', compute) == 'b'
+    assert compute.call_count == 2
+    compute = Mock(return_value='c')
+    store.get('b', lambda: store.invalidate() or 'b')
+    assert store.get('b', compute) == 'c'
+
+
+def test_cache_store_negative_ttl_and_sweep():
+    from flatline.decorator import CacheStore
+    now = [0.0]
+    store = CacheStore(ttl=300, negative_ttl=30, clock=lambda: now[0])
+    compute = Mock(side_effect=[None, 'found'])
+    assert store.get('missing', compute) is None
+    assert store.get('kept', lambda: 'value') == 'value'
+    now[0] = 29.0
+    assert store.get('missing', compute) is None
+    now[0] = 30.0
+    assert store.get('missing', compute) == 'found'
+    assert compute.call_count == 2
+    store.set('gone', 'value', ttl=10)
+    now[0] = 400.0
+    assert len(store) == 3
+    store.set('new', 'value')
+    assert len(store) == 1
+
+
+def test_node_cache_shared():
+    from flatline.decorator import CacheStore
+    consul = Consul()
+    consul.call = Mock(return_value=({'Node': {'Address': '10.0.0.1'}}, None))
+    cache = CacheStore()
+    assert Node(consul, None, None, 'foobar', [], cache=cache).ip == '10.0.0.1'
+    node = Node(consul, None, None, 'foobar', [], cache=cache)
+    assert node.ip == '10.0.0.1'
+    consul.call.assert_called_once_with('GET', 'v1/catalog/node/foobar', {})
+    del node.blob
+    assert Node(consul, None, None, 'foobar', [], cache=cache).blob
+    assert consul.call.call_count == 2
+    node.instance_id = 'i-1234'
+    assert Node(None, None, None, 'foobar', [], cache=cache).instance_id == \
+        'i-1234'
+
+
+def test_router_route(monkeypatch):
+    from flatline.aws import DEFAULT_ROUTE, Route, Router
+    router = Router(
+        None,
+        {
+            '10.0.0.0/8': Route('us-east-1', None),
+            '10.1.0.0/16': Route('eu-west-1', 'arn:aws:iam::1:role/flatline'),
+        },
+        region_key='aws-region',
+    )
+
+    def node(address, meta=None):
+        node = Node(None, None, None, address, [])
+        node.blob = {'Node': {'Address': address, 'Meta': meta}}
+        return node
+
+    assert router.route(node('10.2.0.1')) == Route('us-east-1', None)
+    assert router.route(node('10.1.0.1')) == Route(
+        'eu-west-1', 'arn:aws:iam::1:role/flatline',
+    )
+    assert router.route(node('192.168.0.1')) == DEFAULT_ROUTE
+    assert router.route(node('10.1.0.1', {
+        'aws-region': 'us-west-2',
+        'aws-role-arn': 'arn:aws:iam::2:role/flatline',
+    })) == Route('us-west-2', 'arn:aws:iam::2:role/flatline')
+    missing = Node(None, None, None, 'missing', [])
+    missing.blob = None
+    assert router.route(missing) == DEFAULT_ROUTE
+    assert missing.instance_id is None
+    assert Route.parse('us-west-2') == Route('us-west-2', None)
+
+
+def test_client_pool_reuse(monkeypatch):
+    from flatline.aws import ClientPool, Route
+    pool = ClientPool()
+    create = Mock(side_effect=lambda route: (route.region, route.region))
+    monkeypatch.setattr(pool, 'create', create)
+    assert pool.clients(Route('us-east-1', None)) == ('us-east-1',) * 2
+    assert pool.clients(Route('us-east-1', None)) == ('us-east-1',) * 2
+    assert pool.clients(Route('us-west-2', None)) == ('us-west-2',) * 2
+    assert create.call_count == 2
+
+
+def test_update_health_routed(monkeypatch):
+    import threading
+    from flatline.aws import DEFAULT_ROUTE, Route
+    east, west = Route('us-east-1', None), Route('us-west-2', None)
+    routes = {'a': east, 'b': west, 'c': east, 'd': DEFAULT_ROUTE}
+    router = Mock()
+    router.route.side_effect = lambda node: routes[node.name]
+    router.clients.side_effect = lambda route: (
+        'ec2-' + route.region, 'asg-' + route.region,
+    )
+    nodes = []
+    for name in sorted(routes):
+        node = Mock(is_asg_instance=True)
+        node.name = name
+        nodes.append(node)
+    monkeypatch.setattr(Worker, 'get_nodes', Mock(return_value={}))
+    monkeypatch.setattr(Worker, 'diff_nodes', Mock(return_value=nodes))
+    # Only passes if all three routes are handled at the same time.
+    barrier = threading.Barrier(3, timeout=5)
+    groups = []
+
+    def update_nodes(self, group):
+        barrier.wait()
+        groups.append(sorted(node.name for node in group))
+
+    monkeypatch.setattr(Worker, 'update_nodes', update_nodes)
+    worker = Worker(None, 'ec2', 'asg', router=router)
+    assert set(worker.group_nodes(nodes)) == {east, west, DEFAULT_ROUTE}
+    assert (nodes[0].ec2, nodes[0].asg) == ('ec2-us-east-1', 'asg-us-east-1')
+    assert (nodes[1].ec2, nodes[1].asg) == ('ec2-us-west-2', 'asg-us-west-2')
+    assert (nodes[3].ec2, nodes[3].asg) == ('ec2', 'asg')
+    worker.update_health()
+    assert sorted(groups) == [['a', 'c'], ['b'], ['d']]
+
+
+def _watch(responses):
+    from flatline.watch import Watch
+    consul = Consul()
+    consul.call = Mock(side_effect=responses)
+    watch = Watch(consul, 'v1/health/state/any', min_interval=0)
+    watch.random = lambda: 0.0
+    now = [0.0]
+    watch.clock = lambda: now[0]
+    watch.sleep = Mock()
+    return watch, consul, now
+
+
+def test_watch_index_regression():
+    watch, consul, _ = _watch([
+        ([], '100'), ([], '50'), ([], '50'),
+    ])
+    watch.poll()
+    watch.poll()
+    assert watch.index == '50'
+    assert watch.changed is True
+    assert watch.resets == 1
+    watch.poll()
+    assert watch.changed is False
+    assert watch.spurious_wakeups == 1
+    assert consul.call.call_args_list[1][0][2]['index'] == '100'
+    assert consul.call.call_args_list[2][0][2]['index'] == '50'
+
+
+def test_watch_zero_index():
+    watch, consul, _ = _watch([([], '0'), ([], None)])
+    watch.poll()
+    assert watch.index == '1'
+    watch.poll()
+    assert watch.index == '1'
+    assert consul.call.call_args_list[1][0][2] == {
+        'wait': '60s',
+        'index': '1',
+    }
+    assert watch.resets == 2
+
+
+def test_get_nodes_forgets_departed(monkeypatch):
+    checks = [[MockCheck('a', '1', True), MockCheck('b', '1', True)]]
+    monkeypatch.setattr(Worker, 'get_checks', lambda _: checks[0])
+    worker = Worker(None, None, None)
+    nodes = worker.get_nodes()
+    nodes['a'].instance_id = 'i-old'
+    nodes['b'].instance_id = 'i-b'
+    checks[0] = [MockCheck('b', '1', True)]
+    worker.get_nodes()
+    checks[0] = [MockCheck('a', '1', True), MockCheck('b', '1', True)]
+    nodes = worker.get_nodes()
+    assert worker.cache.peek(('instance_id', 'a')) is None
+    assert nodes['b'].instance_id == 'i-b'
+
+
+def test_node_negative_lookup():
+    from flatline import NEGATIVE_CACHE_TTL
+    ec2 = Mock()
+    ec2.describe_instances.side_effect = [
+        {'Reservations': []},
+        {'Reservations': [{'Instances': [{'InstanceId': 'i-1234'}]}]},
+    ]
+    worker = Worker(None, ec2, None)
+    now = [0.0]
+    worker.cache.clock = lambda: now[0]
+
+    def node():
+        node = Node(None, ec2, None, 'a', [], cache=worker.cache)
+        node.ip = '10.0.0.1'
+        return node
+
+    assert node().instance_id is None
+    now[0] = NEGATIVE_CACHE_TTL
+    assert node().instance_id == 'i-1234'
+    assert ec2.describe_instances.call_count == 2
+
+
+def test_get_nodes_repeated_invalid_index():
+    consul = Consul()
+    consul.call = Mock(side_effect=[
+        ([_check_blob('a', 'serfHealth', 'passing')], None),
+        ([_check_blob('a', 'serfHealth', 'critical')], None),
+    ])
+    worker = Worker(consul, None, None)
+    worker.watch.min_interval = 0
+    worker.prev_nodes = worker.get_nodes()
+    assert worker.prev_nodes['a'].healthy is True
+    nodes = worker.get_nodes()
+    assert worker.watch.changed is True
+    assert nodes['a'].healthy is False
+
+
+def test_watch_jitter_and_min_interval():
+    watch, consul, now = _watch([([], '1'), ([], '2')])
+    watch.min_interval = 5.0
+    watch.random = lambda: 0.999
+    watch.poll()
+    watch.sleep.assert_not_called()
+    now[0] = 2.0
+    watch.poll()
+    watch.sleep.assert_called_once_with(3.0)
+    assert consul.call.call_args_list[1][0][2]['wait'] == '63s'
+    assert watch.stats() == {
+        'index': '2',
+        'wakeups': 2,
+        'spurious_wakeups': 0,
+        'resets': 0,
+    }
+
+
+def test_get_nodes_unchanged(monkeypatch):
+    checks = [MockCheck('healthy', '1', True)]
+    monkeypatch.setattr(Worker, 'get_checks', lambda _: checks)
+    worker = Worker(None, None, None)
+    nodes = worker.get_nodes()
+    worker.prev_nodes = nodes
+    worker.watch.changed = False
+    assert worker.get_nodes() is nodes
+    worker.watch.changed = True
+    assert worker.get_nodes() is not nodes
+
+
+def test_get_decoder():
+    from flatline.codec import get_decoder
+    name, loads = get_decoder('json')
+    assert name == 'json'
+    assert loads(b'{"a": [1, "\\u00e9"]}') == {'a': [1, u'é']}
+    name, loads = get_decoder()
+    assert loads(b'[true]') == [True]
+    with pytest.raises(ValueError):
+        get_decoder('bogus')
+
+
+def test_consul_call(monkeypatch):
+    import logging
+    import requests
+    response = Mock(
+        status_code=200,
+        content=b'[{"Node": "foobar"}]',
+        headers={'X-Consul-Index': '12'},
+    )
+    type(response).text = property(
+        lambda _: pytest.fail('Response text should not be built.'),
+    )
+    request = Mock(return_value=response)
+    monkeypatch.setattr(requests, 'request', request)
+    monkeypatch.setattr(
+        logging.getLogger('flatline'), 'isEnabledFor', lambda _: False,
+    )
+    consul = Consul('http://consul:8500/', decoder='json')
+    assert consul.get('v1/health/state/any', {'index': '11'}) == (
+        [{'Node': 'foobar'}], '12',
+    )
+    request.assert_called_once_with(
+        'GET',
+        'http://consul:8500/v1/health/state/any',
+        params={'index': '11'},
+        json={},
+        timeout=70,
+    )
+
+
+def _control_worker():
+    asg = Mock()
+    worker = Worker(None, None, asg)
+    for name, healthy in [('web-1', True), ('web-2', False)]:
+        node = Node(
+            None, None, asg, name, [MockCheck(name, '1', healthy)],
+            cache=worker.cache,
+        )
+        node.instance_id = 'i-' + name
+        node.asg_name = 'web'
+        worker.prev_nodes[name] = node
+    return worker, asg
+
+
+def test_worker_pause_resume(monkeypatch):
+    worker, asg = _control_worker()
+    nodes = dict(worker.prev_nodes)
+    flipped = Node(
+        None, None, asg, 'web-2', [MockCheck('web-2', '1', True)],
+        cache=worker.cache,
+    )
+    nodes['web-2'] = flipped
+    monkeypatch.setattr(Worker, 'get_nodes', lambda _: nodes)
+    worker.pause()
+    worker.update_health()
+    asg.set_instance_health.assert_not_called()
+    assert list(worker.pending) == ['web-2']
+    assert worker.describe()['nodes']['web-2'] == {
+        'healthy': True,
+        'pending': True,
+        'ip': None,
+        'instance_id': 'i-web-2',
+        'asg_name': 'web',
+    }
+    assert worker.resume() == ['web-2']
+    asg.set_instance_health.assert_called_once_with(
+        InstanceId='i-web-2',
+        HealthStatus='Healthy',
+    )
+    assert worker.pending == {}
+
+
+def test_worker_resume_journal(monkeypatch, tmpdir):
+    path = str(tmpdir.join('journal.log'))
+    worker, asg = _control_worker()
+    worker.journal = Journal(path)
+    nodes = dict(worker.prev_nodes)
+    nodes['web-2'] = Node(
+        None, None, asg, 'web-2', [MockCheck('web-2', '1', True)],
+        cache=worker.cache,
+    )
+    monkeypatch.setattr(Worker, 'get_nodes', lambda _: nodes)
+    worker.pause()
+    worker.last_index = '5'
+    worker.last_observed = 1000.0
+    worker.update_health()
+    worker.last_index = '9'
+    worker.last_observed = 2000.0
+    worker.update_health()
+    assert worker.resume() == ['web-2']
+    with open(path) as fh:
+        events = [json.loads(line) for line in fh]
+    assert [e['event'] for e in events] == ['transition']
+    assert events[0]['node'] == 'web-2'
+    assert events[0]['index'] == '5'
+    assert events[0]['observed_at'] == 1000.0
+
+
+def test_worker_resync_journal(tmpdir):
+    path = str(tmpdir.join('journal.log'))
+    worker, asg = _control_worker()
+    worker.journal = Journal(path)
+    node = worker.prev_nodes['web-1']
+    node.consul = Mock()
+    node.consul.get.return_value = ({'Node': {'Address': '10.0.0.1'}}, None)
+    node.ec2 = Mock()
+    node.ec2.describe_instances.return_value = {
+        'Reservations': [{'Instances': [{'InstanceId': 'i-web-1'}]}],
+    }
+    asg.describe_auto_scaling_instances.return_value = {
+        'AutoScalingInstances': [{'AutoScalingGroupName': 'web'}],
+    }
+    worker.last_index = '5'
+    worker.last_observed = 1000.0
+    worker.resync_node('web-1')
+    assert worker.journal.latency.total == 0
+    with open(path) as fh:
+        events = [json.loads(line) for line in fh]
+    assert [e['event'] for e in events] == ['resync']
+    assert events[0]['node'] == 'web-1'
+    assert events[0]['latency'] is None
+
+
+def test_worker_invalidate():
+    worker, _ = _control_worker()
+    assert worker.invalidate('web-1') == 2
+    assert worker.describe()['nodes']['web-1']['instance_id'] is None
+    assert worker.describe()['nodes']['web-2']['instance_id'] == 'i-web-2'
+    assert worker.invalidate() == 2
+    assert len(worker.cache) == 0
+
+
+def test_control_socket(monkeypatch):
+    import shutil
+    import tempfile
+    from flatline.control import ControlServer, send
+    worker, asg = _control_worker()
+    ec2 = Mock()
+    ec2.describe_instances.return_value = {
+        'Reservations': [{'Instances': [{'InstanceId': 'i-web-1'}]}],
+    }
+    consul = Consul()
+    consul.call = Mock(return_value=({'Node': {'Address': '10.0.0.1'}}, None))
+    worker.prev_nodes['web-1'].consul = consul
+    worker.prev_nodes['web-1'].ec2 = ec2
+    asg.describe_auto_scaling_instances.return_value = {
+        'AutoScalingInstances': [{'AutoScalingGroupName': 'web'}],
+    }
+    tmp = tempfile.mkdtemp()
+    path = tmp + '/control.sock'
+    server = ControlServer(path, worker)
+    server.start()
+    try:
+        response = send(path, {'command': 'dump'})
+        assert response['ok'] is True
+        assert set(response['result']['nodes']) == {'web-1', 'web-2'}
+
+        response = send(path, {'command': 'resync', 'node': 'web-1'})
+        assert response == {
+            'ok': True,
+            'result': {'node': 'web-1', 'healthy': True},
+        }
+        # The instance is looked up afresh before its health is set.
+        consul.call.assert_called_once_with(
+            'GET', 'v1/catalog/node/web-1', {},
+        )
+        ec2.describe_instances.assert_called_once_with(Filters=[{
+            'Name': 'private-ip-address',
+            'Values': ['10.0.0.1'],
+        }])
+        asg.set_instance_health.assert_called_once_with(
+            InstanceId='i-web-1',
+            HealthStatus='Healthy',
+        )
+
+        response = send(path, {'command': 'resync', 'node': 'nope'})
+        assert response['ok'] is False
+        assert send(path, {'command': 'pause'})['result'] == {'paused': True}
+        assert worker.paused is True
+        assert send(path, {'command': 'resume'})['result'] == {
+            'paused': False,
+            'dispatched': [],
+        }
+        assert send(path, {'command': 'bogus'})['ok'] is False
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmp)
+
+
+def test_worker_resync_asg():
+    worker, asg = _control_worker()
+    worker.consul = Consul()
+    worker.consul.call = Mock(return_value=([
+        {'Node': 'web-1', 'Address': '10.0.0.1'},
+        {'Node': 'web-2', 'Address': '10.0.0.2'},
+    ], '12'))
+    worker.ec2 = Mock()
+    worker.ec2.get_paginator.return_value.paginate.return_value = [
+        {'Reservations': [{'Instances': [
+            {'InstanceId': 'i-1', 'PrivateIpAddress': '10.0.0.1'},
+            {'InstanceId': 'i-2', 'PrivateIpAddress': '10.0.0.2'},
+        ]}]},
+    ]
+    asg.describe_auto_scaling_instances.return_value = {
+        'AutoScalingInstances': [
+            {
+                'InstanceId': 'i-1',
+                'AutoScalingGroupName': 'web',
+                'HealthStatus': 'HEALTHY',
+            },
+            {
+                'InstanceId': 'i-2',
+                'AutoScalingGroupName': 'other',
+                'HealthStatus': 'HEALTHY',
+            },
+        ],
+    }
+    summary = worker.resync_asg('web')
+    assert summary['asg_instances'] == 1
+    assert summary['updated'] == 1
+    # Already healthy, but forced.
+    asg.set_instance_health.assert_called_once_with(
+        InstanceId='i-1',
+        HealthStatus='Healthy',
+    )
+
+
+POLICY = {
+    'rules': [
+        {'check': 'service:noisy*', 'ignore': True},
+        {'service': 'batch', 'status': {'warning': 'passing'}},
+    ],
+    'groups': [
+        {'meta': {'role': 'web*'}, 'required': ['serfHealth', 'service:web']},
+    ],
+}
+
+
+def _policy_blob(node, id, status, service='', index=1):
+    blob = _check_blob(node, id, status)
+    blob['ServiceName'] = service
+    blob['ModifyIndex'] = index
+    return blob
+
+
+def test_policy_verdict(monkeypatch):
+    from flatline.policy import Policy
+    policy = Policy.from_config(POLICY)
+    assert policy.verdict(_policy_blob('a', 'serfHealth', 'passing')) is True
+    assert policy.verdict(
+        _policy_blob('a', 'serfHealth', 'warning', index=2),
+    ) is False
+    assert policy.verdict(
+        _policy_blob('a', 'service:noisy-1', 'critical'),
+    ) is None
+    assert policy.verdict(
+        _policy_blob('a', 'service:batch', 'warning', 'batch'),
+    ) is True
+    assert policy.verdict(
+        _policy_blob('a', 'service:batch', 'critical', 'batch', 2),
+    ) is False
+    with pytest.raises(ValueError):
+        Policy.from_config({'rules': [{'status': {'warning': 'fine'}}]})
+    with pytest.raises(ValueError):
+        Policy.from_config({'rules': [{'status': {'warnig': 'passing'}}]})
+    with pytest.raises(ValueError):
+        Policy.from_config({'rule': []})
+    with pytest.raises(ValueError):
+        Policy.from_config({'rules': [{'checks': '*'}]})
+
+
+def test_policy_verdict_cache(monkeypatch):
+    from flatline.policy import Policy
+    policy = Policy.from_config(POLICY)
+    judge = Mock(wraps=policy.judge)
+    monkeypatch.setattr(policy, 'judge', judge)
+    blob = _policy_blob('a', 'serfHealth', 'passing', index=5)
+    policy.verdict(blob)
+    policy.begin()
+    assert policy.verdict(dict(blob)) is True
+    assert judge.call_count == 1
+    assert policy.verdict(dict(blob, Status='critical', ModifyIndex=6)) \
+        is False
+    assert judge.call_count == 2
+    # Checks unseen for a whole cycle are forgotten.
+    policy.begin()
+    policy.begin()
+    policy.verdict(dict(blob, Status='critical', ModifyIndex=6))
+    assert judge.call_count == 3
+
+
+def test_get_nodes_policy(monkeypatch):
+    pytest.importorskip('numpy')
+    from flatline.policy import Policy
+    blobs = [
+        # Warning on a batch service is tolerated.
+        _policy_blob('batch-1', 'serfHealth', 'passing'),
+        _policy_blob('batch-1', 'service:batch', 'warning', 'batch'),
+        # Noisy checks are ignored.
+        _policy_blob('db-1', 'serfHealth', 'passing'),
+        _policy_blob('db-1', 'service:noisy', 'critical', 'noisy'),
+        # Web nodes need both required checks.
+        _policy_blob('web-1', 'serfHealth', 'passing'),
+        _policy_blob('web-1', 'service:web', 'passing', 'web'),
+        _policy_blob('web-2', 'serfHealth', 'passing'),
+        _policy_blob('web-3', 'serfHealth', 'passing'),
+        _policy_blob('web-3', 'service:web', 'critical', 'web'),
+    ]
+    consul = Consul()
+    consul.call = Mock(return_value=([
+        {'Node': 'batch-1', 'Address': '10.0.0.1', 'Meta': {}},
+        {'Node': 'db-1', 'Address': '10.0.0.2', 'Meta': None},
+        {'Node': 'web-1', 'Address': '10.0.0.3', 'Meta': {'role': 'web'}},
+        {'Node': 'web-2', 'Address': '10.0.0.4', 'Meta': {'role': 'web'}},
+        {'Node': 'web-3', 'Address': '10.0.0.5', 'Meta': {'role': 'web'}},
+    ], '12'))
+    monkeypatch.setattr(Worker, 'get_check_blobs', lambda _: blobs)
+    expected = {
+        'batch-1': True,
+        'db-1': True,
+        'web-1': True,
+        'web-2': False,
+        'web-3': False,
+    }
+    for columnar in [False, True]:
+        consul.call.reset_mock()
+        policy = Policy.from_config(POLICY)
+        worker = Worker(consul, None, None, columnar=columnar, policy=policy)
+        nodes = worker.get_nodes()
+        assert {
+            name: node.healthy for name, node in nodes.items()
+        } == expected
+        # Node meta comes from one bulk catalog query.
+        consul.call.assert_called_once_with('GET', 'v1/catalog/nodes', {})